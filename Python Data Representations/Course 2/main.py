@@ -3,7 +3,21 @@ Project for Week 4 of "Python Data Representations".
 Find differences in file contents.
 """
 
+import argparse
+import csv
+import hashlib
+import io
+import json
+import mmap
+import os
+import timeit
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+
 IDENTICAL = -1
+CHUNK_SIZE = 1 << 20
+DIFF_BLOCK = 64
+MMAP_BLOCK = 1 << 20
 
 
 def singleline_diff(line1, line2):
@@ -11,13 +25,41 @@ def singleline_diff(line1, line2):
     Returns the index where the first difference between
     line1 and line2 occurs. Returns IDENTICAL if no difference.
     """
+    if line1 == line2:
+        return IDENTICAL
     min_len = min(len(line1), len(line2))
-    for idx in range(min_len):
+    start, stop = mismatch_block(line1, line2, min_len)
+    for idx in range(start, stop):
         if line1[idx] != line2[idx]:
             return idx
-    if len(line1) != len(line2):
-        return min_len
-    return IDENTICAL
+    return min_len
+
+
+def mismatch_block(line1, line2, min_len):
+    """
+    Narrows down where line1 and line2 first differ by comparing
+    slices, so that long lines are scanned by C-level equality checks
+    rather than one character at a time. Returns (start, stop) such
+    that the first difference before min_len, if any, is in
+    range(start, stop), which is at most DIFF_BLOCK long.
+    """
+    start = 0
+    step = DIFF_BLOCK
+    while start < min_len:
+        stop = min(start + step, min_len)
+        if line1[start:stop] != line2[start:stop]:
+            break
+        start = stop
+        step *= 2
+    else:
+        return (min_len, min_len)
+    while stop - start > DIFF_BLOCK:
+        mid = (start + stop) // 2
+        if line1[start:mid] == line2[start:mid]:
+            start = mid
+        else:
+            stop = mid
+    return (start, stop)
 
 
 def singleline_diff_format(line1, line2, idx):
@@ -65,14 +107,560 @@ def file_diff_format(filename1, filename2):
     lines1 = get_file_lines(filename1)
     lines2 = get_file_lines(filename2)
     line_num, idx = multiline_diff(lines1, lines2)
-
     if line_num == IDENTICAL:
-        return "No differences\n"
+        return format_file_diff(line_num, idx, "", "")
 
     line1 = lines1[line_num] if line_num < len(lines1) else ""
     line2 = lines2[line_num] if line_num < len(lines2) else ""
 
+    return format_file_diff(line_num, idx, line1, line2)
+
+
+def format_file_diff(line_num, idx, line1, line2):
+    """
+    Formats the first difference found between two files.
+    Returns 'No differences\\n' if line_num is IDENTICAL.
+    """
+    if line_num == IDENTICAL:
+        return "No differences\n"
+
     diff = singleline_diff_format(line1, line2, idx)
     return f"Line {line_num}:\n{diff}"
 
 
+def read_rest_of_line(file, buf, chunk_size=CHUNK_SIZE):
+    """
+    Returns the text from buf up to the next newline, reading further
+    chunks from file as needed. Returns None if buf is empty and file
+    is already exhausted.
+    """
+    pieces = []
+    while True:
+        end = buf.find('\n')
+        if end != -1:
+            pieces.append(buf[:end])
+            return ''.join(pieces)
+        if buf:
+            pieces.append(buf)
+        buf = file.read(chunk_size)
+        if not buf:
+            return ''.join(pieces) if pieces else None
+
+
+def stream_first_diff(file1, file2, chunk_size=CHUNK_SIZE, line_num=0):
+    """
+    Reads two open text files in lockstep and stops at the first
+    difference. Returns a tuple (line_num, idx, line1, line2) with the
+    same meaning as multiline_diff plus the two differing lines, or
+    (IDENTICAL, IDENTICAL, "", "") if the files have the same lines.
+    Memory use is one chunk per file plus the current line.
+    """
+    prefix = ""
+    while True:
+        buf1 = file1.read(chunk_size)
+        buf2 = file2.read(chunk_size)
+        pos = singleline_diff(buf1, buf2)
+        if pos == IDENTICAL:
+            if not buf1:
+                return (IDENTICAL, IDENTICAL, "", "")
+            pos = len(buf1)
+        same = buf1[:pos]
+        last_newline = same.rfind('\n')
+        if last_newline == -1:
+            prefix += same
+        else:
+            line_num += same.count('\n')
+            prefix = same[last_newline + 1:]
+        if pos < len(buf1) or pos < len(buf2):
+            break
+
+    rest1 = buf1[pos:]
+    rest2 = buf2[pos:]
+    if prefix and (not rest1 or not rest2):
+        # One file ends in the middle of a line that the other file
+        # terminates; the lines only differ if more lines follow.
+        shorter, longer_file, longer = (
+            (1, file2, rest2) if not rest1 else (2, file1, rest1))
+        if longer[0] == '\n':
+            next_line = read_rest_of_line(longer_file, longer[1:], chunk_size)
+            if next_line is None:
+                return (IDENTICAL, IDENTICAL, "", "")
+            if shorter == 1:
+                return (line_num + 1, 0, "", next_line)
+            return (line_num + 1, 0, next_line, "")
+
+    line1 = prefix + (read_rest_of_line(file1, rest1, chunk_size) or "")
+    line2 = prefix + (read_rest_of_line(file2, rest2, chunk_size) or "")
+    return (line_num, len(prefix), line1, line2)
+
+
+def file_diff_format_streaming(filename1, filename2, chunk_size=CHUNK_SIZE):
+    """
+    Same result as file_diff_format, but reads both files in lockstep
+    chunks and stops at the first difference instead of loading
+    every line of both files.
+    """
+    with open(filename1, 'r', encoding='utf-8') as file1, \
+            open(filename2, 'r', encoding='utf-8') as file2:
+        return format_file_diff(*stream_first_diff(file1, file2, chunk_size))
+
+
+def first_byte_diff(map1, map2, block_size=MMAP_BLOCK):
+    """
+    Returns the offset of the first byte where map1 and map2 differ,
+    skipping identical blocks with a single comparison each. Returns
+    the length of the shorter map if one is a prefix of the other.
+    """
+    min_len = min(len(map1), len(map2))
+    offset = 0
+    while offset < min_len:
+        end = min(offset + block_size, min_len)
+        block1 = map1[offset:end]
+        block2 = map2[offset:end]
+        if block1 != block2:
+            return offset + singleline_diff(block1, block2)
+        offset = end
+    return min_len
+
+
+def count_line_breaks(data, end, block_size=MMAP_BLOCK):
+    """
+    Counts the line breaks in data[:end] as universal newlines mode
+    sees them: '\\n', '\\r\\n' and a lone '\\r' each end one line.
+    """
+    count = 0
+    offset = 0
+    while offset < end:
+        stop = min(offset + block_size, end)
+        block = data[offset:stop]
+        count += block.count(b'\n')
+        if b'\r' in block:
+            count += block.count(b'\r') - block.count(b'\r\n')
+            if block.endswith(b'\r') and stop < end and data[stop:stop + 1] == b'\n':
+                count -= 1
+        offset = stop
+    return count
+
+
+def file_diff_format_mmap(filename1, filename2, block_size=MMAP_BLOCK):
+    """
+    Same result as file_diff_format, for large files that are mostly
+    identical. Both files are memory-mapped and compared block by
+    block as raw bytes; only the text from the start of the line that
+    holds the first differing byte is decoded and diffed.
+    """
+    with open(filename1, 'rb') as raw1, open(filename2, 'rb') as raw2:
+        if os.fstat(raw1.fileno()).st_size == 0 or os.fstat(raw2.fileno()).st_size == 0:
+            return file_diff_format_streaming(filename1, filename2)
+        with mmap.mmap(raw1.fileno(), 0, access=mmap.ACCESS_READ) as map1, \
+                mmap.mmap(raw2.fileno(), 0, access=mmap.ACCESS_READ) as map2:
+            offset = first_byte_diff(map1, map2, block_size)
+            if offset == len(map1) == len(map2):
+                return format_file_diff(IDENTICAL, IDENTICAL, "", "")
+            # Resume from the start of the line so that line endings
+            # which differ only in bytes ('\r\n' vs '\n') and the
+            # column are resolved with text semantics.
+            line_start = map1.rfind(b'\n', 0, offset) + 1
+            line_num = count_line_breaks(map1, line_start, block_size)
+
+        raw1.seek(line_start)
+        raw2.seek(line_start)
+        file1 = io.TextIOWrapper(raw1, encoding='utf-8')
+        file2 = io.TextIOWrapper(raw2, encoding='utf-8')
+        try:
+            return format_file_diff(*stream_first_diff(file1, file2, line_num=line_num))
+        finally:
+            file1.detach()
+            file2.detach()
+
+
+def file_digest(filename, chunk_size=CHUNK_SIZE):
+    """
+    Returns a tuple (size, sha256 hex digest) for the given file.
+    """
+    digest = hashlib.sha256()
+    with open(filename, 'rb') as file:
+        for chunk in iter(lambda: file.read(chunk_size), b''):
+            digest.update(chunk)
+    return (os.path.getsize(filename), digest.hexdigest())
+
+
+def diff_file_pair(pair):
+    """
+    Returns the file_diff_format result for a (filename1, filename2)
+    pair. Files with the same size and content hash are reported as
+    identical without being diffed. A pair that cannot be read or
+    decoded gives 'Error: <reason>\n' instead, so one bad pair does
+    not stop a batch.
+    """
+    filename1, filename2 = pair
+    try:
+        if os.path.getsize(filename1) == os.path.getsize(filename2) \
+                and file_digest(filename1) == file_digest(filename2):
+            return format_file_diff(IDENTICAL, IDENTICAL, "", "")
+        return file_diff_format_mmap(filename1, filename2)
+    except (OSError, UnicodeDecodeError) as error:
+        return f"Error: {error}\n"
+
+
+class DiffCache:
+    """
+    Persistent LRU cache of file_diff_format results, stored as JSON.
+
+    Each entry is keyed by the pair of absolute paths and records the
+    size, mtime and SHA-256 digest of both files. If size and mtime are
+    unchanged the cached result is returned without reading the files;
+    if only the mtime changed, the digests are checked before diffing
+    again. At most max_entries pairs are kept, least recently used
+    first out.
+    """
+
+    def __init__(self, filename, max_entries=1024):
+        self.filename = filename
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+        # The cache is only an optimisation: a missing, unreadable or
+        # corrupt file just means starting empty
+        try:
+            with open(filename, 'r', encoding='utf-8') as file:
+                entries = json.load(file)
+        except (OSError, ValueError):
+            entries = {}
+        if isinstance(entries, dict):
+            self.entries.update(entries)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.save()
+
+    def file_diff_format(self, filename1, filename2):
+        """
+        Returns file_diff_format(filename1, filename2), from the cache
+        when neither file has changed.
+        """
+        key = f"{os.path.abspath(filename1)}\n{os.path.abspath(filename2)}"
+        stats = [file_stat(filename1), file_stat(filename2)]
+        entry = self.entries.get(key)
+        if entry is not None and entry["stats"] == stats:
+            self.entries.move_to_end(key)
+            return entry["result"]
+
+        digests = [file_digest(filename1)[1], file_digest(filename2)[1]]
+        if entry is not None and entry["digests"] == digests:
+            result = entry["result"]
+        elif stats[0][0] == stats[1][0] and digests[0] == digests[1]:
+            result = format_file_diff(IDENTICAL, IDENTICAL, "", "")
+        else:
+            result = file_diff_format_mmap(filename1, filename2)
+
+        self.entries[key] = {"stats": stats, "digests": digests, "result": result}
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+        return result
+
+    def save(self):
+        """
+        Writes the cache to its file, replacing the old contents atomically.
+        """
+        temp_filename = f"{self.filename}.tmp"
+        with open(temp_filename, 'w', encoding='utf-8') as file:
+            json.dump(self.entries, file)
+        os.replace(temp_filename, self.filename)
+
+
+def file_stat(filename):
+    """
+    Returns [size, mtime in nanoseconds] for the given file.
+    """
+    stat = os.stat(filename)
+    return [stat.st_size, stat.st_mtime_ns]
+
+
+def directory_files(dirname):
+    """
+    Returns the set of names of the regular files in dirname.
+    """
+    return {name for name in os.listdir(dirname)
+            if os.path.isfile(os.path.join(dirname, name))}
+
+
+def directory_pairs(dirname1, dirname2):
+    """
+    Returns a sorted list of (filename1, filename2) pairs for the files
+    that are present under the same name in both directories.
+    """
+    names = directory_files(dirname1) & directory_files(dirname2)
+    return [(os.path.join(dirname1, name), os.path.join(dirname2, name))
+            for name in sorted(names)]
+
+
+def directory_only_files(dirname1, dirname2):
+    """
+    Returns a sorted list of the paths of files that are present in
+    only one of the two directories, and so are left out of
+    directory_pairs.
+    """
+    names1 = directory_files(dirname1)
+    names2 = directory_files(dirname2)
+    return sorted([os.path.join(dirname1, name) for name in names1 - names2]
+                  + [os.path.join(dirname2, name) for name in names2 - names1])
+
+
+def read_manifest(manifest):
+    """
+    Returns the list of (filename1, filename2) pairs listed one per row
+    in the given two-column CSV file.
+    """
+    with open(manifest, 'r', newline='', encoding='utf-8') as csvfile:
+        return [(row[0], row[1]) for row in csv.reader(csvfile) if row]
+
+
+def batch_file_diff(pairs, workers=None, chunksize=4):
+    """
+    Diffs every (filename1, filename2) pair across a process pool and
+    yields (filename1, filename2, result) tuples in the order of pairs,
+    as soon as each result and all those before it are ready.
+    """
+    pairs = list(pairs)
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        results = executor.map(diff_file_pair, pairs, chunksize=chunksize)
+        for (filename1, filename2), result in zip(pairs, results):
+            yield (filename1, filename2, result)
+
+
+def intern_lines(lines, table):
+    """
+    Returns a list of integer codes for lines, where equal lines get
+    the same code. Codes are assigned through the shared dict table.
+    """
+    return [table.setdefault(line, len(table)) for line in lines]
+
+
+def common_run(seq1, lo1, hi1, seq2, lo2, hi2):
+    """
+    Returns the length of the longest common prefix of seq1[lo1:hi1]
+    and seq2[lo2:hi2], comparing slices of doubling size and then
+    bisecting, as mismatch_block does for strings.
+    """
+    limit = min(hi1 - lo1, hi2 - lo2)
+    run = 0
+    step = 8
+    while run < limit:
+        stop = min(run + step, limit)
+        if seq1[lo1 + run:lo1 + stop] != seq2[lo2 + run:lo2 + stop]:
+            break
+        run = stop
+        step *= 2
+    else:
+        return limit
+    while stop - run > 1:
+        mid = (run + stop) // 2
+        if seq1[lo1 + run:lo1 + mid] == seq2[lo2 + run:lo2 + mid]:
+            run = mid
+        else:
+            stop = mid
+    return run
+
+
+def common_run_back(seq1, lo1, hi1, seq2, lo2, hi2):
+    """
+    Returns the length of the longest common suffix of seq1[lo1:hi1]
+    and seq2[lo2:hi2], searching backwards like common_run.
+    """
+    limit = min(hi1 - lo1, hi2 - lo2)
+    run = 0
+    step = 8
+    while run < limit:
+        stop = min(run + step, limit)
+        if seq1[hi1 - stop:hi1 - run] != seq2[hi2 - stop:hi2 - run]:
+            break
+        run = stop
+        step *= 2
+    else:
+        return limit
+    while stop - run > 1:
+        mid = (run + stop) // 2
+        if seq1[hi1 - mid:hi1 - run] == seq2[hi2 - mid:hi2 - run]:
+            run = mid
+        else:
+            stop = mid
+    return run
+
+
+def middle_snake(seq1, lo1, hi1, seq2, lo2, hi2):
+    """
+    Finds the middle snake of a shortest edit script between
+    seq1[lo1:hi1] and seq2[lo2:hi2] (Myers' linear space refinement).
+    Both ranges must be non-empty. Returns (start1, start2, end1, end2),
+    the absolute start and end of the snake in each sequence.
+    """
+    len1 = hi1 - lo1
+    len2 = hi2 - lo2
+    delta = len1 - len2
+    odd = delta & 1
+    max_d = (len1 + len2 + 1) // 2
+    offset = max_d + 1
+    forward = [0] * (2 * offset + 1)
+    backward = [0] * (2 * offset + 1)
+    for depth in range(max_d + 1):
+        for diag in range(-depth, depth + 1, 2):
+            if diag == -depth or (diag != depth and
+                                  forward[offset + diag - 1] < forward[offset + diag + 1]):
+                pos1 = forward[offset + diag + 1]
+            else:
+                pos1 = forward[offset + diag - 1] + 1
+            pos2 = pos1 - diag
+            start1, start2 = pos1, pos2
+            if pos1 < len1 and pos2 < len2 and seq1[lo1 + pos1] == seq2[lo2 + pos2]:
+                run = common_run(seq1, lo1 + pos1, hi1, seq2, lo2 + pos2, hi2)
+                pos1 += run
+                pos2 += run
+            forward[offset + diag] = pos1
+            if odd and -(depth - 1) <= delta - diag <= depth - 1 \
+                    and pos1 + backward[offset + delta - diag] >= len1:
+                return (lo1 + start1, lo2 + start2, lo1 + pos1, lo2 + pos2)
+        for diag in range(-depth, depth + 1, 2):
+            if diag == -depth or (diag != depth and
+                                  backward[offset + diag - 1] < backward[offset + diag + 1]):
+                pos1 = backward[offset + diag + 1]
+            else:
+                pos1 = backward[offset + diag - 1] + 1
+            pos2 = pos1 - diag
+            start1, start2 = pos1, pos2
+            if pos1 < len1 and pos2 < len2 and seq1[hi1 - pos1 - 1] == seq2[hi2 - pos2 - 1]:
+                run = common_run_back(seq1, lo1, hi1 - pos1, seq2, lo2, hi2 - pos2)
+                pos1 += run
+                pos2 += run
+            backward[offset + diag] = pos1
+            if not odd and -depth <= delta - diag <= depth \
+                    and pos1 + forward[offset + delta - diag] >= len1:
+                return (hi1 - pos1, hi2 - pos2, hi1 - start1, hi2 - start2)
+    raise AssertionError("no middle snake found")
+
+
+def iter_diff_edits(seq1, seq2):
+    """
+    Yields the edits of a shortest edit script from seq1 to seq2, in
+    order, as (start1, end1, start2, end2) tuples meaning that
+    seq1[start1:end1] is replaced by seq2[start2:end2]. Adjacent edits
+    are not merged. Uses O(ND) time and linear space.
+    """
+    stack = [(0, len(seq1), 0, len(seq2))]
+    while stack:
+        lo1, hi1, lo2, hi2 = stack.pop()
+        run = common_run(seq1, lo1, hi1, seq2, lo2, hi2)
+        lo1 += run
+        lo2 += run
+        run = common_run_back(seq1, lo1, hi1, seq2, lo2, hi2)
+        hi1 -= run
+        hi2 -= run
+        if lo1 == hi1 or lo2 == hi2:
+            if lo1 < hi1 or lo2 < hi2:
+                yield (lo1, hi1, lo2, hi2)
+            continue
+        start1, start2, end1, end2 = middle_snake(seq1, lo1, hi1, seq2, lo2, hi2)
+        stack.append((end1, hi1, end2, hi2))
+        stack.append((lo1, start1, lo2, start2))
+
+
+def iter_diff_hunks(lines1, lines2):
+    """
+    Yields every differing hunk between two lists of strings, in order,
+    as (start1, end1, start2, end2) tuples meaning that
+    lines1[start1:end1] is replaced by lines2[start2:end2]. Lines are
+    interned to integers before diffing, and each hunk is yielded as
+    soon as it is complete.
+    """
+    table = {}
+    codes1 = intern_lines(lines1, table)
+    codes2 = intern_lines(lines2, table)
+    return merge_diff_edits(iter_diff_edits(codes1, codes2))
+
+
+def merge_diff_edits(edits):
+    """
+    Merges edits that touch each other into single hunks.
+    """
+    pending = None
+    for edit in edits:
+        if pending is not None and pending[1] == edit[0] and pending[3] == edit[2]:
+            pending = (pending[0], edit[1], pending[2], edit[3])
+            continue
+        if pending is not None:
+            yield pending
+        pending = edit
+    if pending is not None:
+        yield pending
+
+
+def iter_file_diff_hunks(filename1, filename2):
+    """
+    Yields every differing hunk between two files, as iter_diff_hunks
+    does for their lists of lines. Only one copy of each distinct line
+    is kept in memory while the files are read.
+    """
+    table = {}
+    codes = []
+    for filename in (filename1, filename2):
+        with open(filename, 'r', encoding='utf-8') as file:
+            codes.append(intern_lines((line.rstrip('\n\r') for line in file), table))
+    table.clear()
+    return merge_diff_edits(iter_diff_edits(codes[0], codes[1]))
+
+
+def benchmark_singleline_diff(length=1 << 22, number=5):
+    """
+    Times singleline_diff against a plain per-character loop on two
+    lines of the given length that differ only in the last character.
+    """
+    def loop_diff(line1, line2):
+        min_len = min(len(line1), len(line2))
+        for idx in range(min_len):
+            if line1[idx] != line2[idx]:
+                return idx
+        if len(line1) != len(line2):
+            return min_len
+        return IDENTICAL
+
+    line1 = '{"key": "value"} ' * (length // 17) + 'a'
+    line2 = line1[:-1] + 'b'
+    for name, func in (("per-character loop", loop_diff),
+                       ("singleline_diff", singleline_diff)):
+        seconds = timeit.timeit(lambda: func(line1, line2), number=number) / number
+        print(f"{name}: {seconds * 1000:.2f} ms per call ({len(line1)} chars)")
+
+
+def main(argv=None):
+    """
+    Command line entry point: diffs two directories or the pairs in a
+    manifest file and prints each result, or runs the benchmarks.
+    """
+    parser = argparse.ArgumentParser(description="Find the first difference between files.")
+    parser.add_argument("dirs", nargs="*", metavar="DIR",
+                        help="two directories whose same-named files are compared; "
+                             "files found in only one of them are listed as 'Only in'")
+    parser.add_argument("--manifest", help="CSV file listing filename1,filename2 pairs")
+    parser.add_argument("--workers", type=int, default=None, help="number of worker processes")
+    parser.add_argument("--benchmark", action="store_true", help="run the benchmarks")
+    args = parser.parse_args(argv)
+
+    if args.benchmark:
+        benchmark_singleline_diff()
+        return
+    if args.manifest:
+        pairs = read_manifest(args.manifest)
+    elif len(args.dirs) == 2:
+        pairs = directory_pairs(*args.dirs)
+        for filename in directory_only_files(*args.dirs):
+            print(f"Only in {os.path.dirname(filename)}: {os.path.basename(filename)}")
+    else:
+        parser.error("give two directories or --manifest")
+    for filename1, filename2, result in batch_file_diff(pairs, args.workers):
+        print(f"{filename1} {filename2}\n{result}")
+
+
+if __name__ == "__main__":
+    main()
@@ -5,7 +5,16 @@ This script processes historical MLB batting data to compute
 top players based on various batting statistics.
 """
 
+import bisect
 import csv
+import hashlib
+import heapq
+import io
+import json
+import os
+import time
+from array import array
+from operator import itemgetter
 
 
 ###########################################################
@@ -83,6 +92,93 @@ def slugging_percentage(info, batting_stats):
         return 0.0
 
 
+###########################################################
+# Column versions of the batting statistic functions
+###########################################################
+
+COLUMN_FORMULAS = {}
+
+
+def register_column_formula(row_formula):
+    """
+    Decorator registering a function as the column version of row_formula.
+
+    A column formula takes (info, columns), where columns maps field
+    names to equal-length sequences (see stats_to_columns), and returns
+    the value of row_formula for every position in one pass.
+    """
+    def register(column_formula):
+        COLUMN_FORMULAS[row_formula] = column_formula
+        return column_formula
+    return register
+
+
+@register_column_formula(batting_average)
+def batting_average_columns(info, columns):
+    """
+    Compute the batting average for every player in columns.
+    """
+    return [hits / at_bats if at_bats >= 500 else 0.0
+            for hits, at_bats in zip(columns[info["hits"]], columns[info["atbats"]])]
+
+
+@register_column_formula(onbase_percentage)
+def onbase_percentage_columns(info, columns):
+    """
+    Compute the on-base percentage for every player in columns.
+    """
+    return [(hits + walks) / (at_bats + walks) if at_bats + walks >= 500 else 0.0
+            for hits, walks, at_bats in zip(columns[info["hits"]], columns[info["walks"]],
+                                            columns[info["atbats"]])]
+
+
+@register_column_formula(slugging_percentage)
+def slugging_percentage_columns(info, columns):
+    """
+    Compute the slugging percentage for every player in columns.
+    """
+    result = []
+    for hits, doubles, triples, homeruns, at_bats in zip(
+            columns[info["hits"]], columns[info["doubles"]], columns[info["triples"]],
+            columns[info["homeruns"]], columns[info["atbats"]]):
+        if at_bats >= 500:
+            singles = hits - doubles - triples - homeruns
+            total_bases = singles + 2 * doubles + 3 * triples + 4 * homeruns
+            result.append(total_bases / at_bats)
+        else:
+            result.append(0.0)
+    return result
+
+
+def stats_to_columns(info, statistics):
+    """
+    Convert batting statistics dictionaries to columns.
+
+    Returns a dictionary mapping the player ID field to a list of IDs
+    and each of the batting fields to an array of ints.
+    """
+    columns = {info["playerid"]: [stat[info["playerid"]] for stat in statistics]}
+    for field in info["battingfields"]:
+        columns[field] = array('q', (int(stat.get(field, 0)) for stat in statistics))
+    return columns
+
+
+def slice_columns(columns, start, end):
+    """
+    Return the rows start to end of columns, as new columns.
+    """
+    return {field: column[start:end] for field, column in columns.items()}
+
+
+def top_player_ids_columns(info, columns, formula, numplayers):
+    """
+    Same result as top_player_ids, computed with the column version of formula.
+    """
+    values = COLUMN_FORMULAS[formula](info, columns)
+    player_stats = zip(columns[info["playerid"]], values)
+    return heapq.nlargest(numplayers, player_stats, key=itemgetter(1))
+
+
 ###########################################################
 # Part 1: Compute top batting stats by year
 ###########################################################
@@ -94,17 +190,48 @@ def filter_by_year(statistics, year, yearid):
     return [stat for stat in statistics if int(stat[yearid]) == year]
 
 
+def build_year_index(statistics, yearid):
+    """
+    Group batting statistics by year for repeated year queries.
+
+    Returns (stats_by_year, years): the statistics in ascending year
+    order (file order within a year) and the matching list of int
+    years, for use with filter_by_year_range.
+    """
+    stats_by_year = sorted(statistics, key=lambda stat: int(stat[yearid]))
+    years = [int(stat[yearid]) for stat in stats_by_year]
+    return (stats_by_year, years)
+
+
+def filter_by_year_range(stats_by_year, years, first_year, last_year):
+    """
+    Return the statistics from first_year to last_year inclusive.
+
+    Uses the index from build_year_index, so the cost is a binary search
+    plus the number of rows returned rather than a scan of every row.
+    """
+    start, end = year_range_bounds(years, first_year, last_year)
+    return stats_by_year[start:end]
+
+
+def year_range_bounds(years, first_year, last_year):
+    """
+    Return (start, end) such that years[start:end] are the entries of the
+    sorted list years from first_year to last_year inclusive.
+    """
+    return (bisect.bisect_left(years, first_year), bisect.bisect_right(years, last_year))
+
+
 def top_player_ids(info, statistics, formula, numplayers):
     """
     Compute top players with the given formula and return their IDs and stats.
+
+    Only the best numplayers entries are kept in a heap while the
+    statistics stream past; ties keep their input order, as with a
+    stable descending sort.
     """
-    player_stats = []
-    for stat in statistics:
-        value = formula(info, stat)
-        player_stats.append((stat[info["playerid"]], value))
-    # Sort by stat descending
-    player_stats.sort(key=lambda x: x[1], reverse=True)
-    return player_stats[:numplayers]
+    player_stats = ((stat[info["playerid"]], formula(info, stat)) for stat in statistics)
+    return heapq.nlargest(numplayers, player_stats, key=itemgetter(1))
 
 
 def lookup_player_names(info, top_ids_and_stats):
@@ -117,6 +244,13 @@ def lookup_player_names(info, top_ids_and_stats):
         info["separator"],
         info["quote"]
     )
+    return format_player_names(info, master_dict, top_ids_and_stats)
+
+
+def format_player_names(info, master_dict, top_ids_and_stats):
+    """
+    Return formatted list of top players, looking names up in master_dict.
+    """
     result = []
     for player_id, stat in top_ids_and_stats:
         first_name = master_dict[player_id][info["firstname"]]
@@ -160,6 +294,69 @@ def aggregate_by_player_id(statistics, playerid, fields):
     return aggregated
 
 
+def factorize(keys):
+    """
+    Map each key to a small integer code.
+
+    Returns (codes, uniques): an array with the code of every key and
+    the list of distinct keys, in order of first appearance, so that
+    uniques[codes[i]] == keys[i].
+    """
+    index = {}
+    codes = array('q', [index.setdefault(key, len(index)) for key in keys])
+    return (codes, list(index))
+
+
+def group_sum(columns, group_fields, fields):
+    """
+    Sum columns grouped by the values of one or more other columns.
+
+    columns maps field names to equal-length sequences. The group keys
+    are factorized to integer codes in one pass, then each field is
+    added into an array of per-group totals indexed by code. Returns
+    (group_keys, totals): the distinct keys in order of first
+    appearance (single values for one group field, tuples for several)
+    and a dictionary mapping each field to its array of totals.
+    """
+    if len(group_fields) == 1:
+        keys = columns[group_fields[0]]
+    else:
+        keys = zip(*(columns[field] for field in group_fields))
+    codes, group_keys = factorize(keys)
+    totals = {}
+    for field in fields:
+        total = array('q', [0]) * len(group_keys)
+        for code, value in zip(codes, columns[field]):
+            total[code] += value
+        totals[field] = total
+    return (group_keys, totals)
+
+
+def aggregate_columns(columns, group_fields, fields):
+    """
+    Same shape as aggregate_by_player_id, computed with group_sum.
+
+    Returns a dictionary mapping each group key to a dictionary of its
+    group field values and field totals.
+    """
+    group_keys, totals = group_sum(columns, group_fields, fields)
+    aggregated = {}
+    for code, key in enumerate(group_keys):
+        values = key if len(group_fields) > 1 else (key,)
+        group = dict(zip(group_fields, values))
+        for field in fields:
+            group[field] = totals[field][code]
+        aggregated[key] = group
+    return aggregated
+
+
+def decade_column(years):
+    """
+    Return the decade (1990, 2000, ...) of every year in years.
+    """
+    return array('q', (int(year) // 10 * 10 for year in years))
+
+
 def compute_top_stats_career(info, formula, numplayers):
     """
     Compute top players over their entire career.
@@ -180,6 +377,356 @@ def compute_top_stats_career(info, formula, numplayers):
     return lookup_player_names(info, top_players)
 
 
+###########################################################
+# Part 2b: Incremental career stats for growing batting files
+###########################################################
+
+CHECK_BYTES = 4096
+READ_CHUNK = 1 << 20
+
+
+class CareerStore:
+    """
+    Career totals kept in a JSON file, together with the byte offset up
+    to which the batting file has been folded into them.
+
+    refresh() only reads the rows appended since the last refresh. The
+    bytes just before the stored offset (and at the start of the file)
+    are fingerprinted, so a batting file that was rewritten rather than
+    appended to is detected and the totals are rebuilt from scratch.
+    The totals are also rebuilt when the file, fields, player id,
+    separator or quote in info differ from the ones they were built
+    with. A last row without a trailing newline is counted as it
+    stands and replaced once more is appended to it.
+    Rows are split on newlines, so fields must not contain line breaks.
+    """
+
+    def __init__(self, info, store_file):
+        self.info = info
+        self.store_file = store_file
+        self.state = None
+        if os.path.exists(store_file):
+            with open(store_file, encoding='utf-8') as jsonfile:
+                self.state = json.load(jsonfile)
+        if self.state is None or self.state.get("options") != self.options():
+            self.reset()
+
+    def options(self):
+        """
+        Return the parts of info that the stored totals depend on.
+        """
+        info = self.info
+        return {"battingfile": info["battingfile"], "battingfields": list(info["battingfields"]),
+                "playerid": info["playerid"], "separator": info["separator"],
+                "quote": info["quote"]}
+
+    def reset(self):
+        """
+        Forget all totals so the next refresh reads the whole file.
+        """
+        self.state = {"options": self.options(), "offset": 0, "fieldnames": None,
+                      "head": "", "tail": "", "partial": None, "totals": {}}
+
+    def fingerprints(self, rawfile, offset):
+        """
+        Return hashes of the bytes at the start of the file and just
+        before offset.
+        """
+        rawfile.seek(0)
+        head = hashlib.sha256(rawfile.read(min(CHECK_BYTES, offset))).hexdigest()
+        start = max(offset - CHECK_BYTES, 0)
+        rawfile.seek(start)
+        tail = hashlib.sha256(rawfile.read(offset - start)).hexdigest()
+        return (head, tail)
+
+    def refresh(self):
+        """
+        Fold rows appended to the batting file since the last refresh into
+        the totals, save them if anything changed, and return the career
+        stats in the shape aggregate_by_player_id returns.
+        """
+        info = self.info
+        with open(info["battingfile"], 'rb') as rawfile:
+            size = os.fstat(rawfile.fileno()).st_size
+            state = self.state
+            if state["offset"] > size or \
+                    self.fingerprints(rawfile, state["offset"]) != (state["head"], state["tail"]):
+                self.reset()
+                state = self.state
+
+            start_offset = state["offset"]
+            old_partial = state["partial"]
+            partial_bytes = old_partial["text"].encode('utf-8') if old_partial else b''
+            rawfile.seek(start_offset)
+            if size - start_offset == len(partial_bytes) and \
+                    rawfile.read(len(partial_bytes)) == partial_bytes:
+                return state["totals"]
+
+            if old_partial:
+                self.unfold_partial()
+            rawfile.seek(start_offset)
+            pending = b''
+            for chunk in iter(lambda: rawfile.read(READ_CHUNK), b''):
+                pending += chunk
+                end = pending.rfind(b'\n') + 1
+                if end:
+                    self.fold_lines(pending[:end].decode('utf-8'))
+                    state["offset"] += end
+                    pending = pending[end:]
+            if pending:
+                self.fold_partial(pending)
+
+            if state["offset"] != start_offset:
+                state["head"], state["tail"] = self.fingerprints(rawfile, state["offset"])
+            if state["offset"] != start_offset or state["partial"] != old_partial:
+                self.save()
+        return state["totals"]
+
+    def fold_lines(self, text):
+        """
+        Add the complete CSV lines in text to the totals, reading the
+        header first if nothing has been read yet.
+        """
+        info = self.info
+        state = self.state
+        csvreader = csv.reader(io.StringIO(text, newline=''),
+                               delimiter=info["separator"], quotechar=info["quote"])
+        if state["fieldnames"] is None:
+            state["fieldnames"] = next(csvreader)
+        rows = (dict(zip(state["fieldnames"], row)) for row in csvreader if row)
+        playerid = info["playerid"]
+        totals = state["totals"]
+        for stat in rows:
+            pid = stat[playerid]
+            if pid not in totals:
+                totals[pid] = {playerid: pid}
+                for field in info["battingfields"]:
+                    totals[pid][field] = int(stat.get(field, 0))
+            else:
+                for field in info["battingfields"]:
+                    totals[pid][field] += int(stat.get(field, 0))
+
+    def parse_partial(self, text):
+        """
+        Return the row in text (a last line without a newline) as a
+        dictionary, or None if it is empty.
+        """
+        info = self.info
+        row = next(csv.reader([text], delimiter=info["separator"], quotechar=info["quote"]), [])
+        return dict(zip(self.state["fieldnames"], row)) if row else None
+
+    def fold_partial(self, pending):
+        """
+        Add the unterminated last line pending (bytes) to the totals and
+        remember it in state["partial"] so unfold_partial can take it
+        out again. A header, bytes cut inside a character or a row that
+        ends before the player id or has a field that is not a number
+        yet are left for a later refresh.
+        """
+        state = self.state
+        try:
+            text = pending.decode('utf-8')
+        except UnicodeDecodeError:
+            return
+        stat = self.parse_partial(text) if state["fieldnames"] is not None else None
+        playerid = self.info["playerid"]
+        if stat is None or playerid not in stat:
+            return
+        pid = stat[playerid]
+        try:
+            values = [(field, int(stat.get(field, 0))) for field in self.info["battingfields"]]
+        except ValueError:
+            return
+        totals = state["totals"]
+        new = pid not in totals
+        if new:
+            totals[pid] = {playerid: pid}
+        for field, value in values:
+            totals[pid][field] = totals[pid].get(field, 0) + value
+        state["partial"] = {"text": text, "new": new}
+
+    def unfold_partial(self):
+        """
+        Take the row recorded by fold_partial back out of the totals.
+        """
+        state = self.state
+        partial = state["partial"]
+        stat = self.parse_partial(partial["text"])
+        pid = stat[self.info["playerid"]]
+        if partial["new"]:
+            del state["totals"][pid]
+        else:
+            for field in self.info["battingfields"]:
+                state["totals"][pid][field] -= int(stat.get(field, 0))
+        state["partial"] = None
+
+    def save(self):
+        """
+        Write the totals and offset to the store file atomically.
+        """
+        temp_file = f"{self.store_file}.tmp"
+        with open(temp_file, 'w', encoding='utf-8') as jsonfile:
+            json.dump(self.state, jsonfile)
+        os.replace(temp_file, self.store_file)
+
+
+def compute_top_stats_career_incremental(info, formula, numplayers, store_file):
+    """
+    Same result as compute_top_stats_career, using career totals from a
+    CareerStore so only newly appended batting rows are read.
+    """
+    career_stats = CareerStore(info, store_file).refresh()
+    top_players = top_player_ids(info, list(career_stats.values()), formula, numplayers)
+    return lookup_player_names(info, top_players)
+
+
+###########################################################
+# Part 3: Load-once session for repeated queries
+###########################################################
+
+class BaseballDataset:
+    """
+    Session over one batting file and one master file.
+
+    Each file is read the first time it is needed and kept in memory,
+    with the year and batting fields of every row converted to int,
+    so any number of year and career queries can be answered without
+    parsing the CSV files again.
+    """
+
+    def __init__(self, info):
+        self.info = info
+        self._batting = None
+        self._year_index = None
+        self._year_columns = None
+        self._batting_columns = None
+        self._master = None
+
+    @property
+    def batting(self):
+        """
+        List of batting statistics dictionaries with int fields.
+        """
+        if self._batting is None:
+            info = self.info
+            int_fields = [info["yearid"]] + list(info["battingfields"])
+            batting = read_csv_as_list_dict(info["battingfile"], info["separator"], info["quote"])
+            for stat in batting:
+                for field in int_fields:
+                    stat[field] = int(stat[field])
+            self._batting = batting
+        return self._batting
+
+    @property
+    def year_index(self):
+        """
+        Batting statistics grouped by year, from build_year_index.
+        """
+        if self._year_index is None:
+            self._year_index = build_year_index(self.batting, self.info["yearid"])
+        return self._year_index
+
+    @property
+    def year_columns(self):
+        """
+        The year-ordered batting statistics as columns, from stats_to_columns.
+        """
+        if self._year_columns is None:
+            self._year_columns = stats_to_columns(self.info, self.year_index[0])
+        return self._year_columns
+
+    @property
+    def batting_columns(self):
+        """
+        The batting statistics in file order as columns, from
+        stats_to_columns; more columns are added by column().
+        """
+        if self._batting_columns is None:
+            self._batting_columns = stats_to_columns(self.info, self.batting)
+        return self._batting_columns
+
+    def column(self, field):
+        """
+        The file-order column for field. "decade" is derived from the year.
+        """
+        columns = self.batting_columns
+        if field not in columns:
+            if field == "decade":
+                columns[field] = decade_column(self.column(self.info["yearid"]))
+            else:
+                columns[field] = [stat[field] for stat in self.batting]
+        return columns[field]
+
+    def grouped_stats(self, group_fields):
+        """
+        Totals of the batting fields for every combination of values of
+        group_fields, such as [playerid, "teamID"] or [playerid, "decade"],
+        in the shape aggregate_by_player_id returns.
+        """
+        fields = self.info["battingfields"]
+        columns = {field: self.column(field) for field in list(group_fields) + list(fields)}
+        return aggregate_columns(columns, group_fields, fields)
+
+    def stats_for_years(self, first_year, last_year):
+        """
+        Batting statistics from first_year to last_year inclusive.
+        """
+        stats_by_year, years = self.year_index
+        return filter_by_year_range(stats_by_year, years, first_year, last_year)
+
+    @property
+    def master(self):
+        """
+        Dictionary mapping player IDs to master file rows.
+        """
+        if self._master is None:
+            info = self.info
+            self._master = read_csv_as_nested_dict(
+                info["masterfile"], info["playerid"], info["separator"], info["quote"])
+        return self._master
+
+    def top_stats_year(self, formula, numplayers, year):
+        """
+        Same result as compute_top_stats_year, from the loaded data.
+        """
+        return self.top_stats_years(formula, numplayers, year, year)
+
+    def top_stats_years(self, formula, numplayers, first_year, last_year):
+        """
+        Top single-season statistics from first_year to last_year inclusive.
+        """
+        if formula in COLUMN_FORMULAS:
+            start, end = year_range_bounds(self.year_index[1], first_year, last_year)
+            columns = slice_columns(self.year_columns, start, end)
+            top_players = top_player_ids_columns(self.info, columns, formula, numplayers)
+        else:
+            stats_years = self.stats_for_years(first_year, last_year)
+            top_players = top_player_ids(self.info, stats_years, formula, numplayers)
+        return format_player_names(self.info, self.master, top_players)
+
+    def career_stats(self):
+        """
+        Career totals for every player, as aggregate_by_player_id returns them.
+        """
+        return self.grouped_stats([self.info["playerid"]])
+
+    def top_stats_career(self, formula, numplayers):
+        """
+        Same result as compute_top_stats_career, from the loaded data.
+        """
+        if formula in COLUMN_FORMULAS:
+            playerid = self.info["playerid"]
+            fields = self.info["battingfields"]
+            columns = {field: self.column(field) for field in [playerid] + list(fields)}
+            player_ids, columns = group_sum(columns, [playerid], fields)
+            columns[playerid] = player_ids
+            top_players = top_player_ids_columns(self.info, columns, formula, numplayers)
+        else:
+            career_stats_list = list(self.career_stats().values())
+            top_players = top_player_ids(self.info, career_stats_list, formula, numplayers)
+        return format_player_names(self.info, self.master, top_players)
+
+
 ###########################################################
 # Example baseball data info dictionary
 ###########################################################
@@ -210,18 +757,43 @@ baseballdatainfo = {
 def test_baseball_statistics():
     """
     Run a series of tests on the baseball statistics functions.
+
+    All queries share one BaseballDataset, so each file is parsed once.
     """
+    dataset = BaseballDataset(baseballdatainfo)
+
     print("Top 5 Batting Average in 2010:")
-    print("\n".join(compute_top_stats_year(baseballdatainfo, batting_average, 5, 2010)))
+    print("\n".join(dataset.top_stats_year(batting_average, 5, 2010)))
 
     print("\nTop 5 On-Base Percentage in 2010:")
-    print("\n".join(compute_top_stats_year(baseballdatainfo, onbase_percentage, 5, 2010)))
+    print("\n".join(dataset.top_stats_year(onbase_percentage, 5, 2010)))
 
     print("\nTop 5 Slugging Percentage in 2010:")
-    print("\n".join(compute_top_stats_year(baseballdatainfo, slugging_percentage, 5, 2010)))
+    print("\n".join(dataset.top_stats_year(slugging_percentage, 5, 2010)))
 
     print("\nTop 10 Batting Average Career:")
-    print("\n".join(compute_top_stats_career(baseballdatainfo, batting_average, 10)))
+    print("\n".join(dataset.top_stats_career(batting_average, 10)))
+
+
+def benchmark_formulas(info=None):
+    """
+    Time each batting formula over the whole batting history, per row
+    on the dictionaries from read_csv_as_list_dict and in one pass over
+    columns.
+    """
+    info = info or baseballdatainfo
+    statistics = read_csv_as_list_dict(info["battingfile"], info["separator"], info["quote"])
+    columns = stats_to_columns(info, statistics)
+    for formula in (batting_average, onbase_percentage, slugging_percentage):
+        start = time.perf_counter()
+        per_row = [formula(info, stat) for stat in statistics]
+        row_seconds = time.perf_counter() - start
+        start = time.perf_counter()
+        per_column = COLUMN_FORMULAS[formula](info, columns)
+        column_seconds = time.perf_counter() - start
+        assert per_row == per_column
+        print(f"{formula.__name__}: {row_seconds:.3f} s per row, "
+              f"{column_seconds:.3f} s by column ({len(statistics)} rows)")
 
 
 ###########################################################
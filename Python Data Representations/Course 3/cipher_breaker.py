@@ -0,0 +1,212 @@
+"""
+Breaking Random Substitution Ciphers
+
+This script recovers the key of a substitution cipher such as those
+produced by make_cipher_dict in practice_exercise_mod1.py, using bigram
+frequency scoring and hill climbing.
+
+Text is integer-encoded once (letters to 0-25, everything else to
+SPACE), and the ciphertext is reduced to a table of bigram counts. The
+score of a candidate key is then a sum over that table of precomputed
+log probabilities, so its cost does not depend on the ciphertext length.
+
+Functions:
+- encode_text(text)
+- build_log_table(corpus)
+- count_bigrams(codes)
+- score_key(key, bigram_counts, log_table)
+- crack_cipher(ciphertext, corpus, restarts, seed)
+- benchmark_crack()
+"""
+
+import math
+import random
+import time
+from collections import Counter
+
+ALPHABET = "abcdefghijklmnopqrstuvwxyz"
+SPACE = len(ALPHABET)
+NUM_SYMBOLS = SPACE + 1
+
+ENCODE_TABLE = bytes(ALPHABET.index(chr(byte)) if chr(byte) in ALPHABET else SPACE
+                     for byte in range(256))
+
+SAMPLE_TEXT = """
+When the first settlers came to the valley they found a river that ran
+clear and cold all through the summer, and they built their houses on the
+high ground above it so that the spring floods would not reach them. The
+land was good for wheat and for apples, and within a few years there was a
+mill by the water and a small market where farmers from the hills would
+bring their wool and their cheese to sell. Nobody thought very much about
+the future in those days. There was always work to be done, fences to mend
+and animals to feed, and the seasons turned one into another without anyone
+noticing how quickly the time was passing.
+
+The town grew slowly at first and then all at once. A road was laid along
+the river, and after the road came the railway, and with the railway came
+people who had never seen the valley before and who did not know the names
+of the old families. They opened shops and schools and a newspaper that was
+printed every week in a narrow building next to the bank. The older people
+complained that the place was changing too fast, but their children liked
+the noise and the new faces, and many of them left the farms to take jobs
+in the town. It was not long before the market square was paved with stone
+and lit with lamps that burned through the night.
+
+Every morning the baker opened his door before anyone else was awake, and
+the smell of fresh bread would drift down the street to the station, where
+the first train of the day stood waiting with its engine hissing quietly in
+the dark. The driver and the guard would buy their breakfast from him and
+eat it standing on the platform while they talked about the weather and the
+price of coal. In the winter the snow would lie deep on the hills for weeks,
+and the train was often the only thing that moved in the whole valley. The
+children would run out to watch it pass, and some of them dreamed of riding
+it all the way to the city at the end of the line.
+
+Years later, when the mill had closed and the railway had been taken up,
+people still remembered those mornings. They told their grandchildren about
+the baker and the train and the lamps in the square, and the stories became
+a little better each time they were told. The river still ran clear in the
+summer, and if you stood on the old bridge in the evening you could hear the
+water moving over the stones, the same sound that the first settlers must
+have heard when they looked down from the hill and decided that this was a
+place where they could make a home.
+"""
+
+
+def encode_text(text):
+    """
+    Given a string text, return a bytes object holding one integer
+    code per character: 0-25 for the letters a-z (either case) and
+    SPACE for every other character.
+    """
+    return text.lower().encode("ascii", "replace").translate(ENCODE_TABLE)
+
+
+def count_bigrams(codes):
+    """
+    Given integer-encoded text, return a list of (first, second, count)
+    triples for every bigram that occurs in it.
+    """
+    counts = Counter(zip(codes, codes[1:]))
+    return [(first, second, count) for (first, second), count in counts.items()]
+
+
+def build_log_table(corpus):
+    """
+    Given a string of reference text, return a NUM_SYMBOLS x NUM_SYMBOLS
+    nested list of add-one smoothed bigram log probabilities.
+    """
+    codes = encode_text(corpus)
+    counts = [[1] * NUM_SYMBOLS for _ in range(NUM_SYMBOLS)]
+    for first, second, count in count_bigrams(codes):
+        counts[first][second] += count
+    total = sum(map(sum, counts))
+    return [[math.log(count / total) for count in row] for row in counts]
+
+
+def score_key(key, bigram_counts, log_table):
+    """
+    Return the log likelihood of the text decrypted with key, where key
+    is a list mapping each cipher code to a plaintext code and
+    bigram_counts comes from count_bigrams of the ciphertext.
+    """
+    return sum(count * log_table[key[first]][key[second]]
+               for first, second, count in bigram_counts)
+
+
+def frequency_key(codes, corpus_codes):
+    """
+    Return the starting key that maps the n-th most common cipher
+    letter to the n-th most common letter of the reference text.
+    """
+    def by_frequency(text_codes):
+        counts = Counter(code for code in text_codes if code != SPACE)
+        return sorted(range(SPACE), key=lambda code: -counts[code])
+
+    key = [SPACE] * NUM_SYMBOLS
+    for cipher_code, plain_code in zip(by_frequency(codes), by_frequency(corpus_codes)):
+        key[cipher_code] = plain_code
+    return key
+
+
+def hill_climb(key, bigram_counts, log_table):
+    """
+    Improve key by swapping pairs of plaintext letters until no single
+    swap raises the score. Return (score, key, keys evaluated).
+    """
+    best = score_key(key, bigram_counts, log_table)
+    evaluated = 1
+    improved = True
+    while improved:
+        improved = False
+        for first in range(SPACE):
+            for second in range(first + 1, SPACE):
+                key[first], key[second] = key[second], key[first]
+                score = score_key(key, bigram_counts, log_table)
+                evaluated += 1
+                if score > best:
+                    best = score
+                    improved = True
+                else:
+                    key[first], key[second] = key[second], key[first]
+    return (best, key, evaluated)
+
+
+def crack_cipher(ciphertext, corpus=SAMPLE_TEXT, restarts=5, seed=None):
+    """
+    Given a string ciphertext and a string of reference text in the
+    same language, return (cipher_dict, keys evaluated) where
+    cipher_dict is the recovered decipher dictionary mapping cipher
+    letters to plaintext letters. The first climb starts from letter
+    frequencies and each restart from a random key.
+    """
+    rng = random.Random(seed)
+    codes = encode_text(ciphertext)
+    log_table = build_log_table(corpus)
+    bigram_counts = count_bigrams(codes)
+
+    start = frequency_key(codes, encode_text(corpus))
+    best_score, best_key, evaluated = hill_climb(start, bigram_counts, log_table)
+    for _ in range(restarts):
+        start = rng.sample(range(SPACE), SPACE) + [SPACE]
+        score, key, count = hill_climb(start, bigram_counts, log_table)
+        evaluated += count
+        if score > best_score:
+            best_score, best_key = score, key
+
+    cipher_dict = {ALPHABET[code]: ALPHABET[best_key[code]] for code in range(SPACE)}
+    return (cipher_dict, evaluated)
+
+
+def benchmark_crack(sizes=(250, 500, 1000, 2000, 4000), restarts=5, seed=0):
+    """
+    For several ciphertext sizes, encrypt a slice of text with a random
+    key, crack it, and print the fraction of letters recovered, the time
+    taken and the number of keys scored per second. The first half of
+    SAMPLE_TEXT (by paragraph) is the reference corpus and the second
+    half the plaintext, so accuracy is measured on text the bigram
+    table was not built from (repeated for sizes longer than it).
+    """
+    paragraphs = SAMPLE_TEXT.split("\n\n")
+    corpus = "\n\n".join(paragraphs[:len(paragraphs) // 2])
+    held_out = "\n\n".join(paragraphs[len(paragraphs) // 2:])
+    rng = random.Random(seed)
+    for size in sizes:
+        plaintext = (held_out * (size // len(held_out) + 1))[:size]
+        shuffled = rng.sample(ALPHABET, len(ALPHABET))
+        ciphertext = plaintext.translate(str.maketrans(ALPHABET, "".join(shuffled)))
+
+        start = time.perf_counter()
+        decipher_dict, evaluated = crack_cipher(ciphertext, corpus, restarts, seed)
+        seconds = time.perf_counter() - start
+
+        recovered = ciphertext.translate(str.maketrans(decipher_dict))
+        letters = [char for char in plaintext if char in ALPHABET]
+        correct = sum(1 for char, guess in zip(plaintext, recovered)
+                      if char in ALPHABET and char == guess)
+        print(f"{size:6d} chars: {correct / len(letters):6.1%} letters correct, "
+              f"{seconds:6.2f} s, {evaluated / seconds:8.0f} keys/s")
+
+
+if __name__ == "__main__":
+    benchmark_crack()
@@ -1,4 +1,9 @@
 import copy
+import csv
+import time
+from array import array
+import tracemalloc
+from collections.abc import MutableMapping
 
 # 1 A list consisting of five empty lists
 nested_list = [[], [], [], [], []]
@@ -65,3 +70,303 @@ grades = [
 ]
 final_grade_table = make_grade_table(names, grades)
 print("Final grade table from function:", final_grade_table)
+
+# 11 Copy-on-write alternative to dict_copies
+# A CowDict reads through to a shared template dictionary and keeps its
+# own changes in a small overlay, so a copy costs almost nothing until
+# it is modified. Immutable values are shared; a mutable value is copied
+# the first time it is read from the template (nested dictionaries
+# become CowDicts themselves). The template must not be changed while
+# copies of it are in use. A CowDict is a Mapping, not a dict: use
+# to_dict() where a real dict is needed, e.g. for json.dumps or code
+# that checks isinstance(value, dict).
+IMMUTABLE_TYPES = (int, float, complex, str, bytes, bool, type(None), frozenset)
+
+def is_immutable(value):
+    if isinstance(value, tuple):
+        return all(is_immutable(item) for item in value)
+    return isinstance(value, IMMUTABLE_TYPES)
+
+def cow_copy(value):
+    if type(value) is dict:
+        return CowDict(value)
+    return copy.deepcopy(value)
+
+class CowDict(MutableMapping):
+    __slots__ = ("base", "local", "deleted")
+
+    def __init__(self, base):
+        self.base = base
+        self.local = {}
+        self.deleted = set()
+
+    def __getitem__(self, key):
+        if key in self.local:
+            return self.local[key]
+        if key in self.deleted:
+            raise KeyError(key)
+        value = self.base[key]
+        if is_immutable(value):
+            return value
+        value = self.local[key] = cow_copy(value)
+        return value
+
+    def __setitem__(self, key, value):
+        self.local[key] = value
+
+    def __delitem__(self, key):
+        if key in self.local:
+            del self.local[key]
+            if key in self.base:
+                self.deleted.add(key)
+        elif key in self.base and key not in self.deleted:
+            self.deleted.add(key)
+        else:
+            raise KeyError(key)
+
+    def __contains__(self, key):
+        return key in self.local or (key in self.base and key not in self.deleted)
+
+    def __iter__(self):
+        for key in self.base:
+            if key not in self.deleted:
+                yield key
+        for key in self.local:
+            if key not in self.base or key in self.deleted:
+                yield key
+
+    def __len__(self):
+        added = sum(1 for key in self.local if key not in self.base or key in self.deleted)
+        return len(self.base) - len(self.deleted) + added
+
+    # Independent plain dict, with nested CowDicts converted as well
+    def to_dict(self):
+        result = {}
+        for key in self:
+            value = self.local[key] if key in self.local else self.base[key]
+            if isinstance(value, CowDict):
+                result[key] = value.to_dict()
+            else:
+                result[key] = copy.deepcopy(value)
+        return result
+
+    def __repr__(self):
+        return repr(dict(self.items()))
+
+# Same list interface as dict_copies, returning CowDicts that share
+# my_dict instead of dicts
+def cow_dict_copies(my_dict, num_copies):
+    return [CowDict(my_dict) for _ in range(num_copies)]
+
+cow_copies = cow_dict_copies(original_dict, 3)
+cow_copies[0]["a"] = 10
+print("Copy-on-write copies after changing one:", cow_copies)
+
+# 12 Compare time and peak memory of dict_copies and cow_dict_copies
+def benchmark_dict_copies(num_keys=1000, num_copies=500):
+    template = {f"key{i}": [i, i + 1, {"nested": i}] for i in range(num_keys)}
+    for name, func in (("dict_copies (deepcopy)", dict_copies),
+                       ("cow_dict_copies", cow_dict_copies)):
+        tracemalloc.start()
+        start = time.perf_counter()
+        copies = func(template, num_copies)
+        for index, my_copy in enumerate(copies):
+            my_copy["key0"][0] = index
+        seconds = time.perf_counter() - start
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        del copies
+        print(f"{name}: {seconds:.3f} s, peak {peak / 2 ** 20:.1f} MB")
+
+# 13 Compact grids backed by a single array
+# Grid stores all cells in one flat array and returns each row as a
+# memoryview slice, so grid[2][1] reads and writes the array directly
+# without any per-row list objects.
+class Grid:
+    __slots__ = ("num_rows", "num_cols", "data", "view")
+
+    def __init__(self, num_rows, num_cols, typecode="q", fill=0):
+        self.num_rows = num_rows
+        self.num_cols = num_cols
+        self.data = array(typecode, [fill]) * (num_rows * num_cols)
+        self.view = memoryview(self.data)
+
+    # Wrap an existing flat array of num_rows * num_cols cells
+    @classmethod
+    def from_array(cls, num_rows, num_cols, data):
+        grid = cls.__new__(cls)
+        grid.num_rows = num_rows
+        grid.num_cols = num_cols
+        grid.data = data
+        grid.view = memoryview(data)
+        return grid
+
+    def __getitem__(self, row):
+        if not -self.num_rows <= row < self.num_rows:
+            raise IndexError("grid row out of range")
+        row %= self.num_rows
+        return self.view[row * self.num_cols:(row + 1) * self.num_cols]
+
+    def __len__(self):
+        return self.num_rows
+
+    def tolist(self):
+        return [self[row].tolist() for row in range(self.num_rows)]
+
+    def __repr__(self):
+        return repr(self.tolist())
+
+# RaggedArray does the same for rows of different lengths, keeping the
+# start of each row in an offsets array
+class RaggedArray:
+    __slots__ = ("offsets", "data", "view")
+
+    def __init__(self, row_lengths, typecode="q", fill=0):
+        self.offsets = array("q", [0])
+        for length in row_lengths:
+            self.offsets.append(self.offsets[-1] + length)
+        self.data = array(typecode, [fill]) * self.offsets[-1]
+        self.view = memoryview(self.data)
+
+    def __getitem__(self, row):
+        num_rows = len(self.offsets) - 1
+        if not -num_rows <= row < num_rows:
+            raise IndexError("ragged array row out of range")
+        row %= num_rows
+        return self.view[self.offsets[row]:self.offsets[row + 1]]
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def tolist(self):
+        return [self[row].tolist() for row in range(len(self))]
+
+    def __repr__(self):
+        return repr(self.tolist())
+
+# Array-backed equivalent of make_dict_lists: row i holds i zeros
+def make_ragged_lists(length):
+    return RaggedArray(range(length))
+
+grid = Grid(3, 3)
+for row in range(3):
+    for col in range(3):
+        grid[row][col] = 3 * row + col
+print("Grid item with value 7:", grid[2][1])
+print("Ragged array of zeros:", make_ragged_lists(5))
+
+# 14 Compare memory and access speed of nested lists and Grid
+# Cells are filled with distinct values, since a nested list then needs
+# a separate int object per cell on top of the pointer to it
+def benchmark_grid(num_rows=1000, num_cols=1000):
+    for name, make in (("nested lists", lambda: [[0 for _ in range(num_cols)] for _ in range(num_rows)]),
+                       ("Grid", lambda: Grid(num_rows, num_cols))):
+        tracemalloc.start()
+        table = make()
+        for row in range(num_rows):
+            table_row = table[row]
+            for col in range(num_cols):
+                table_row[col] = row * num_cols + col + 1000
+        size = tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+        start = time.perf_counter()
+        total = 0
+        for row in range(num_rows):
+            table_row = table[row]
+            for col in range(num_cols):
+                total += table_row[col]
+        seconds = time.perf_counter() - start
+        del table
+        print(f"{name}: {size / 2 ** 20:.1f} MB, {seconds:.3f} s to read every cell")
+
+# 15 Columnar grade table
+# Names map to row numbers and all scores live in one float Grid, so
+# per-student figures come from row slices and per-assignment figures
+# from strided column slices, without a list per student
+class GradeTable:
+    def __init__(self, name_list, grades_list):
+        self.names = list(name_list)
+        if len(self.names) != len(grades_list):
+            raise ValueError(f"{len(self.names)} names but {len(grades_list)} rows of grades")
+        self.index = {name: row for row, name in enumerate(self.names)}
+        num_cols = len(grades_list[0]) if grades_list else 0
+        data = array("d")
+        for grades in grades_list:
+            if len(grades) != num_cols:
+                raise ValueError("every student needs the same number of grades")
+            data.extend(grades)
+        self.scores = Grid.from_array(len(self.names), num_cols, data)
+
+    # Load a CSV file whose rows are a name followed by one score per
+    # assignment; blank lines are skipped
+    @classmethod
+    def from_csv(cls, file_name, has_header=True):
+        names = []
+        data = array("d")
+        num_cols = None
+        with open(file_name, "r", newline="", encoding="utf-8") as csvfile:
+            rows = (row for row in csv.reader(csvfile) if row)
+            if has_header:
+                next(rows, None)
+            for row in rows:
+                if num_cols is None:
+                    num_cols = len(row) - 1
+                elif len(row) - 1 != num_cols:
+                    raise ValueError("every student needs the same number of grades")
+                names.append(row[0])
+                data.extend(map(float, row[1:]))
+        table = cls.__new__(cls)
+        table.names = names
+        table.index = {name: row for row, name in enumerate(names)}
+        table.scores = Grid.from_array(len(names), num_cols or 0, data)
+        return table
+
+    def __len__(self):
+        return len(self.names)
+
+    def grades(self, name):
+        return self.scores[self.index[name]]
+
+    def column(self, col):
+        return self.scores.data[col::self.scores.num_cols]
+
+    def student_means(self):
+        num_cols = self.scores.num_cols
+        if num_cols == 0 and self.names:
+            raise ValueError("cannot average students over zero assignments")
+        return [sum(self.scores[row]) / num_cols for row in range(len(self.names))]
+
+    def student_maxes(self):
+        if self.scores.num_cols == 0 and self.names:
+            raise ValueError("cannot take student maxes over zero assignments")
+        return [max(self.scores[row]) for row in range(len(self.names))]
+
+    def assignment_means(self):
+        return [sum(self.column(col)) / len(self.names) for col in range(self.scores.num_cols)]
+
+    def assignment_maxes(self):
+        return [max(self.column(col)) for col in range(self.scores.num_cols)]
+
+    # Names ordered by mean score, best first; ties keep their original order
+    def rank_students(self):
+        means = self.student_means()
+        order = sorted(range(len(self.names)), key=means.__getitem__, reverse=True)
+        return [self.names[row] for row in order]
+
+    # Names ordered by score on one assignment, best first
+    def rank_assignment(self, col):
+        column = self.column(col)
+        order = sorted(range(len(self.names)), key=column.__getitem__, reverse=True)
+        return [self.names[row] for row in order]
+
+    def to_dict(self):
+        return {name: self.scores[row].tolist() for row, name in enumerate(self.names)}
+
+columnar_grades = GradeTable(names, grades)
+print("Columnar student means:", columnar_grades.student_means())
+print("Columnar assignment maxes:", columnar_grades.assignment_maxes())
+print("Students ranked by mean:", columnar_grades.rank_students())
+
+if __name__ == "__main__":
+    benchmark_dict_copies()
+    benchmark_grid()
@@ -1,25 +1,27 @@
 import csv
 
-# Print a table row by row
+# Print a table (or any iterable of rows) row by row
 def print_table(table):
     for row in table:
         print(row)
 
-# Read a CSV file and return a nested list
-def read_csv_file(file_name):
-    table = []
+# Yield the rows of a CSV file one at a time, without loading the whole file
+def iter_csv_file(file_name):
     try:
         with open(file_name, "r", newline='', encoding="utf-8") as csvfile:
             reader = csv.reader(csvfile, delimiter=",")
             for row in reader:
-                table.append(row)
+                yield row
     except FileNotFoundError:
         print(f"File '{file_name}' not found.")
     except Exception as e:
         print(f"Error reading '{file_name}': {e}")
-    return table
 
-# Write a nested list to a CSV file
+# Read a CSV file and return a nested list
+def read_csv_file(file_name):
+    return list(iter_csv_file(file_name))
+
+# Write a nested list (or any iterable of rows) to a CSV file
 def write_csv_file(csv_table, file_name):
     try:
         with open(file_name, "w", newline='', encoding="utf-8") as csvfile:
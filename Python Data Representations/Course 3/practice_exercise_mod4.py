@@ -6,15 +6,47 @@ selecting specific columns from 2D tables (nested lists),
 and sorting tables by a numerical column in descending order.
 
 Functions:
+- iter_csv_file(file_name)
 - read_csv_file(file_name)
-- write_csv_file(csv_table, file_name)
+- write_csv_file(csv_table, file_name, compression)
+- make_column_getter(col_indices)
 - select_columns(my_table, col_indices)
+- iter_select_columns(rows, col_indices)
+- iter_csv_columns(file_name, col_indices)
+- trim_csv_file(in_file_name, out_file_name, col_indices)
 - sort_by_column(my_table, col_idx)
+- sort_csv_file_by_column(in_file_name, out_file_name, col_idx, run_size, fan_in)
+- top_rows_by_column(my_table, col_idx, num_rows)
 - print_table(table)
+- test_sort_csv_file_by_column(num_rows, run_size, fan_in)
 - test_part2_code()
 """
 
+import bz2
 import csv
+import gzip
+import heapq
+import lzma
+import os
+import pickle
+import random
+import tempfile
+from itertools import chain, count, islice
+from operator import itemgetter
+
+WRITE_BUFFER = 1 << 20
+COMPRESSORS = {"gzip": gzip.open, "bz2": bz2.open, "xz": lzma.open}
+MERGE_FAN_IN = 32
+
+
+def iter_csv_file(file_name):
+    """
+    Given a file path specified as the string file_name,
+    yield the rows of the associated CSV file one at a time
+    as lists of str, so that only one row is held in memory.
+    """
+    with open(file_name, mode="r", newline='', encoding='utf-8') as csvfile:
+        yield from csv.reader(csvfile)
 
 
 def read_csv_file(file_name):
@@ -24,22 +56,42 @@ def read_csv_file(file_name):
     whose entries are the fields in the CSV file.
     Each entry in the returned table is of type str.
     """
-    with open(file_name, mode="r", newline='', encoding='utf-8') as csvfile:
-        csvreader = csv.reader(csvfile)
-        table = [row for row in csvreader]
-    return table
+    return list(iter_csv_file(file_name))
 
 
-def write_csv_file(csv_table, file_name):
+def write_csv_file(csv_table, file_name, compression=None):
     """
-    Given a nested list csv_table and a file path specified
-    as the string file_name, write entries in the nested list
-    as the fields of a comma-separated CSV file with the specified path.
+    Given a nested list csv_table (or any iterable of rows) and a
+    file path specified as the string file_name, write entries in the
+    nested list as the fields of a comma-separated CSV file with the
+    specified path. Rows are written as they are produced, through a
+    large write buffer. compression may be None, "gzip", "bz2" or "xz".
     """
-    with open(file_name, mode="w", newline='', encoding='utf-8') as csvfile:
+    if compression is None:
+        csvfile = open(file_name, mode="w", newline='', encoding='utf-8',
+                       buffering=WRITE_BUFFER)
+    elif compression in COMPRESSORS:
+        csvfile = COMPRESSORS[compression](file_name, mode="wt", newline='', encoding='utf-8')
+    else:
+        raise ValueError(f"unknown compression {compression!r}, "
+                         f"expected one of {sorted(COMPRESSORS)}")
+    with csvfile:
         csvwriter = csv.writer(csvfile)
-        for row in csv_table:
-            csvwriter.writerow(row)
+        csvwriter.writerows(csv_table)
+
+
+def make_column_getter(col_indices):
+    """
+    Given a list of integers col_indices, return a function that
+    maps a row to a tuple of the items in the specified columns,
+    built once with operator.itemgetter.
+    """
+    if len(col_indices) == 1:
+        col_idx = col_indices[0]
+        return lambda row: (row[col_idx],)
+    if not col_indices:
+        return lambda row: ()
+    return itemgetter(*col_indices)
 
 
 def select_columns(my_table, col_indices):
@@ -48,11 +100,52 @@ def select_columns(my_table, col_indices):
     return a new 2D table (as a nested list) consisting of only
     those items in the specified columns.
     """
-    new_table = []
-    for row in my_table:
-        new_row = [row[col_idx] for col_idx in col_indices]
-        new_table.append(new_row)
-    return new_table
+    getter = make_column_getter(col_indices)
+    return [list(getter(row)) for row in my_table]
+
+
+def iter_select_columns(rows, col_indices):
+    """
+    Given an iterable of rows and a list of integers col_indices,
+    lazily yield each row reduced to a tuple of the items in the
+    specified columns.
+    """
+    return map(make_column_getter(col_indices), rows)
+
+
+def iter_csv_columns(file_name, col_indices):
+    """
+    Given a file path specified as the string file_name and a list
+    of integers col_indices, yield a tuple of the specified columns
+    for each row of the CSV file. Lines without quote characters are
+    split only as far as the last requested column, so the remaining
+    fields are never parsed; a line with a quote character is handed to
+    the csv module, which reads further lines from the file only when
+    a quoted field spans them.
+    """
+    getter = make_column_getter(col_indices)
+    if col_indices and min(col_indices) >= 0:
+        maxsplit = max(col_indices) + 1
+    else:
+        maxsplit = -1
+    with open(file_name, mode="r", newline='', encoding='utf-8') as csvfile:
+        for line in csvfile:
+            if '"' in line:
+                # The reader pulls lines from csvfile one at a time, so the
+                # loop resumes right after the last line of this record
+                row = next(csv.reader(chain([line], csvfile)), [])
+            else:
+                line = line.rstrip('\r\n')
+                row = line.split(',', maxsplit) if line else []
+            yield getter(row)
+
+
+def trim_csv_file(in_file_name, out_file_name, col_indices):
+    """
+    Copy the specified columns of the CSV file in_file_name to the
+    CSV file out_file_name, one row at a time, in constant memory.
+    """
+    write_csv_file(iter_csv_columns(in_file_name, col_indices), out_file_name)
 
 
 def sort_by_column(my_table, col_idx):
@@ -68,9 +161,128 @@ def sort_by_column(my_table, col_idx):
     my_table[:] = [header] + data
 
 
+def top_rows_by_column(my_table, col_idx, num_rows):
+    """
+    Given a nested list (or any iterable of rows, such as
+    iter_csv_file) my_table, an integer col_idx and an integer
+    num_rows, return the header followed by the num_rows rows that
+    sort_by_column would put first. Rows stream through a heap of
+    size num_rows, so this takes O(n log num_rows) time and
+    O(num_rows) memory; rows with equal keys keep their order.
+    """
+    rows = iter(my_table)
+    header = next(rows, None)
+    if header is None:
+        return []
+    top = heapq.nlargest(num_rows, rows, key=lambda row: float(row[col_idx]))
+    return [header] + top
+
+
+def write_sorted_run(pairs, run_file_name, batch_size):
+    """
+    Spill sorted (key, row) pairs (a list or any iterable) to the file
+    run_file_name, pickled in batches of batch_size.
+    """
+    pairs = iter(pairs)
+    with open(run_file_name, "wb") as run_file:
+        while True:
+            batch = list(islice(pairs, batch_size))
+            if not batch:
+                break
+            pickle.dump(batch, run_file, pickle.HIGHEST_PROTOCOL)
+
+
+def iter_sorted_run(run_file_name):
+    """
+    Yield the (key, row) pairs written by write_sorted_run, keeping the
+    file open only while they are being read.
+    """
+    with open(run_file_name, "rb") as run_file:
+        while True:
+            try:
+                batch = pickle.load(run_file)
+            except EOFError:
+                return
+            yield from batch
+
+
+def merge_sorted_runs(run_file_names):
+    """
+    Lazily merge the (key, row) pairs of the given run files into one
+    sequence in descending key order. Pairs with equal keys come out
+    in the order of run_file_names, so merging consecutive runs is stable.
+    """
+    return heapq.merge(*map(iter_sorted_run, run_file_names), key=itemgetter(0), reverse=True)
+
+
+def sort_csv_file_by_column(in_file_name, out_file_name, col_idx, run_size=100000,
+                            fan_in=MERGE_FAN_IN):
+    """
+    Given CSV files in_file_name and out_file_name and an integer
+    col_idx, write the rows of in_file_name to out_file_name with the
+    header first and the remaining rows in descending numerical order
+    of column col_idx, as sort_by_column does. Each run of run_size
+    rows is sorted on pre-parsed float keys and spilled to a temporary
+    file. Runs are merged fan_in at a time, in as many passes as it
+    takes to get down to fan_in runs, and are read back in batches of
+    run_size // fan_in rows, so about run_size rows and fan_in + 1
+    open files are in use at any time. Rows with equal keys keep
+    their order.
+    """
+    rows = iter_csv_file(in_file_name)
+    header = next(rows, None)
+    if header is None:
+        write_csv_file([], out_file_name)
+        return
+    fan_in = max(fan_in, 2)
+    batch_size = max(run_size // fan_in, 1)
+    with tempfile.TemporaryDirectory() as tempdir:
+        run_names = (os.path.join(tempdir, f"run{number}") for number in count())
+        runs = []
+        while True:
+            run = [(float(row[col_idx]), row) for row in islice(rows, run_size)]
+            if not run:
+                break
+            run.sort(key=itemgetter(0), reverse=True)
+            runs.append(next(run_names))
+            write_sorted_run(run, runs[-1], batch_size)
+            del run
+        while len(runs) > fan_in:
+            merged_runs = []
+            for start in range(0, len(runs), fan_in):
+                group = runs[start:start + fan_in]
+                merged_runs.append(next(run_names))
+                write_sorted_run(merge_sorted_runs(group), merged_runs[-1], batch_size)
+                for run_file_name in group:
+                    os.remove(run_file_name)
+            runs = merged_runs
+        write_csv_file(chain([header], map(itemgetter(1), merge_sorted_runs(runs))),
+                       out_file_name)
+
+
+def test_sort_csv_file_by_column(num_rows=5000, run_size=20, fan_in=4):
+    """
+    Check that sort_csv_file_by_column gives the same file as
+    sort_by_column on random rows with many equal keys, using far more
+    runs than fan_in so that several merge passes are needed.
+    """
+    rng = random.Random(0)
+    table = [["id", "value"]] + [[str(index), str(rng.randint(0, 50))]
+                                 for index in range(num_rows)]
+    with tempfile.TemporaryDirectory() as tempdir:
+        in_file_name = os.path.join(tempdir, "unsorted.csv")
+        out_file_name = os.path.join(tempdir, "sorted.csv")
+        write_csv_file(table, in_file_name)
+        sort_csv_file_by_column(in_file_name, out_file_name, 1, run_size, fan_in)
+        result = read_csv_file(out_file_name)
+    sort_by_column(table, 1)
+    print(f"External sort of {num_rows} rows in runs of {run_size} with fan-in {fan_in}:",
+          "ok" if result == table else "MISMATCH")
+
+
 def print_table(table):
     """
-    Print a 2D table in a nicely formatted way.
+    Print a 2D table (or any iterable of rows) in a nicely formatted way.
     """
     for row in table:
         print(", ".join(row))
@@ -98,13 +310,12 @@ def test_part2_code():
 
     # Process cancer-risk data
     print("\nProcessing cancer_risk.csv...")
-    cancer_table = read_csv_file("cancer_risk.csv")
     # Select columns: A, B, C, E, L (0-based indices: 0, 1, 2, 4, 11)
-    trimmed_table = select_columns(cancer_table, [0, 1, 2, 4, 11])
-    write_csv_file(trimmed_table, "cancer_risk_trimmed.csv")
+    trim_csv_file("cancer_risk.csv", "cancer_risk_trimmed.csv", [0, 1, 2, 4, 11])
     print("Trimmed data written to cancer_risk_trimmed.csv.")
 
 
 # Run tests when the script is executed directly
 if __name__ == "__main__":
+    test_sort_csv_file_by_column()
     test_part2_code()
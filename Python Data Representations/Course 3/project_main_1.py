@@ -5,9 +5,36 @@ using Python's csv module. It includes functions to:
 - Read a CSV file into a list of dictionaries
 - Read a CSV file into a nested dictionary
 - Write a list of dictionaries back to a CSV file
+- Read large CSV files in parallel by splitting them into byte ranges
+- Read a CSV file into typed, column-oriented storage
+- Cache parsed CSV files in a binary, column-oriented sidecar file
+- Write large tables in bulk, optionally compressed
 """
 
+import bz2
 import csv
+import glob
+import gzip
+import hashlib
+import io
+import json
+import lzma
+import math
+import mmap
+import os
+import random
+import tempfile
+import time
+import tracemalloc
+from array import array
+from collections.abc import Mapping
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice, repeat
+from operator import itemgetter
+
+SCAN_BLOCK = 1 << 20
+WRITE_BUFFER = 1 << 20
+COMPRESSORS = {"gzip": gzip.open, "bz2": bz2.open, "xz": lzma.open}
 
 def read_csv_fieldnames(filename, separator, quote):
     """
@@ -79,3 +106,819 @@ def write_csv_from_list_dict(filename, table, fieldnames, separator, quote):
         csvwriter.writeheader()
         for row in table:
             csvwriter.writerow(row)
+
+
+def open_csv_for_writing(filename, compression=None):
+    """
+    Inputs:
+      filename    - name of CSV file
+      compression - None, "gzip", "bz2" or "xz"
+    Output:
+      A text file opened for writing CSV data, with a WRITE_BUFFER
+      sized buffer, or compressed with the given stdlib codec.
+    """
+    if compression is None:
+        return open(filename, mode='w', newline='', encoding='utf-8', buffering=WRITE_BUFFER)
+    if compression not in COMPRESSORS:
+        raise ValueError(f"unknown compression {compression!r}, "
+                         f"expected one of {sorted(COMPRESSORS)}")
+    return COMPRESSORS[compression](filename, mode='wt', newline='', encoding='utf-8')
+
+
+def write_csv_from_list_dict_bulk(filename, table, fieldnames, separator, quote,
+                                  compression=None):
+    """
+    Inputs:
+      filename    - name of CSV file
+      table       - iterable of dictionaries containing the table to write
+      fieldnames  - list of strings corresponding to the field names in order
+      separator   - character that separates fields
+      quote       - character used to optionally quote fields
+      compression - None, "gzip", "bz2" or "xz"
+    Output:
+      Writes the same file as write_csv_from_list_dict, but converts each
+      dictionary to a tuple with a precompiled itemgetter and passes all
+      of them to a single writerows call through a large write buffer.
+      Every dictionary must have every field; extra keys are ignored.
+    """
+    getter = itemgetter(*fieldnames) if len(fieldnames) != 1 \
+        else lambda row: (row[fieldnames[0]],)
+    with open_csv_for_writing(filename, compression) as csvfile:
+        csvwriter = csv.writer(csvfile, delimiter=separator, quotechar=quote,
+                               quoting=csv.QUOTE_NONNUMERIC)
+        csvwriter.writerow(fieldnames)
+        csvwriter.writerows(map(getter, table))
+
+
+def count_byte(data, byte, start, end):
+    """
+    Inputs:
+      data  - bytes-like object (such as an mmap)
+      byte  - single byte to count
+      start - first offset to look at
+      end   - offset to stop at
+    Output:
+      Number of occurrences of byte in data[start:end], counted one
+      SCAN_BLOCK at a time so that no large copy is made.
+    """
+    count = 0
+    while start < end:
+        stop = min(start + SCAN_BLOCK, end)
+        count += data[start:stop].count(byte)
+        start = stop
+    return count
+
+
+def next_record_end(data, start, quote_count, quote):
+    """
+    Inputs:
+      data        - bytes-like object holding CSV text
+      start       - offset to search from
+      quote_count - number of quote bytes in data[:start]
+      quote       - quote character as a single byte
+    Output:
+      A tuple (end, quote_count) where end is the offset just past the
+      first newline at or after start that lies outside quotes (or
+      len(data)), and quote_count is the number of quote bytes in
+      data[:end]. A newline is taken to be outside quotes when the
+      number of quote characters before it is even. That holds for
+      files where quotes only appear around (and doubled inside)
+      quoted fields; a literal quote in an unquoted field breaks it,
+      which parse_csv_range detects.
+    """
+    while True:
+        newline = data.find(b'\n', start)
+        if newline == -1:
+            return (len(data), quote_count + count_byte(data, quote, start, len(data)))
+        quote_count += count_byte(data, quote, start, newline)
+        start = newline + 1
+        if quote_count % 2 == 0:
+            return (start, quote_count)
+
+
+def find_record_ranges(filename, num_parts, quote):
+    """
+    Inputs:
+      filename  - name of CSV file
+      num_parts - number of ranges to aim for
+      quote     - character used to optionally quote fields
+    Output:
+      A tuple (header_end, ranges) where header_end is the byte offset
+      just past the header record and ranges is a list of (start, end)
+      byte offsets that cover the rest of the file, each starting and
+      ending on a record boundary.
+    """
+    quote_byte = quote.encode('utf-8')
+    with open(filename, 'rb') as rawfile:
+        size = os.fstat(rawfile.fileno()).st_size
+        if size == 0:
+            return (0, [])
+        with mmap.mmap(rawfile.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            header_end, quote_count = next_record_end(data, 0, 0, quote_byte)
+            ranges = []
+            start = header_end
+            part_size = max((size - header_end) // max(num_parts, 1), 1)
+            while start < size:
+                target = min(start + part_size, size)
+                quote_count += count_byte(data, quote_byte, start, target)
+                end, quote_count = next_record_end(data, target, quote_count, quote_byte)
+                ranges.append((start, end))
+                start = end
+    return (header_end, ranges)
+
+
+def build_records(csvreader, fieldnames):
+    """
+    Inputs:
+      csvreader  - iterator of rows as produced by csv.reader
+      fieldnames - list of field names to build dictionaries with, or
+                   None to return rows as lists
+    Output:
+      The rows as a list, either unchanged or as dictionaries built the
+      way DictReader builds them (skipping blank rows).
+    """
+    if fieldnames is None:
+        return list(csvreader)
+    num_fields = len(fieldnames)
+    rows = []
+    for row in csvreader:
+        if not row:
+            continue
+        record = dict(zip(fieldnames, row))
+        if len(row) > num_fields:
+            record[None] = row[num_fields:]
+        elif len(row) < num_fields:
+            for field in fieldnames[len(row):]:
+                record[field] = None
+        rows.append(record)
+    return rows
+
+
+def parse_csv_range(task):
+    """
+    Inputs:
+      task - tuple (filename, start, end, separator, quote, fieldnames)
+    Output:
+      The records in bytes start to end of the file, parsed with the
+      csv module and built by build_records, or None if the range ends
+      inside a quoted field (so end is not a record boundary).
+    """
+    filename, start, end, separator, quote, fieldnames = task
+    with open(filename, 'rb') as rawfile:
+        rawfile.seek(start)
+        text = rawfile.read(end - start).decode('utf-8')
+    # The reader only asks for another line while a quoted field is
+    # open, so a record that comes back after the lines ran out was
+    # cut off inside quotes
+    exhausted = []
+
+    def lines():
+        yield from io.StringIO(text, newline='')
+        exhausted.append(True)
+
+    rows = []
+    for row in csv.reader(lines(), delimiter=separator, quotechar=quote):
+        if exhausted:
+            return None
+        rows.append(row)
+    return build_records(rows, fieldnames)
+
+
+def read_csv_serial(filename, separator, quote, fieldnames=None):
+    """
+    Inputs:
+      filename   - name of CSV file
+      separator  - character that separates fields
+      quote      - character used to optionally quote fields
+      fieldnames - list of field names to build dictionaries with, or
+                   None to return rows as lists
+    Output:
+      The same records as read_csv_parallel, parsed in this process.
+    """
+    with open(filename, mode='r', newline='', encoding='utf-8') as csvfile:
+        csvreader = csv.reader(csvfile, delimiter=separator, quotechar=quote)
+        next(csvreader, None)
+        return build_records(csvreader, fieldnames)
+
+
+def read_csv_parallel(filename, separator, quote, fieldnames=None, workers=None):
+    """
+    Inputs:
+      filename   - name of CSV file
+      separator  - character that separates fields
+      quote      - character used to optionally quote fields
+      fieldnames - list of field names to build dictionaries with, or
+                   None to return rows as lists
+      workers    - number of worker processes (default: CPU count)
+    Output:
+      The records after the header record, in file order. The file is
+      split into byte ranges aligned on record boundaries and each
+      range is parsed in a separate process. If a range turns out not
+      to end on a record boundary, the whole file is parsed serially
+      with read_csv_serial instead.
+    """
+    workers = workers or os.cpu_count() or 1
+    header_end, ranges = find_record_ranges(filename, workers * 4, quote)
+    header_task = (filename, 0, header_end, separator, quote, None)
+    if parse_csv_range(header_task) is None:
+        return read_csv_serial(filename, separator, quote, fieldnames)
+    tasks = [(filename, start, end, separator, quote, fieldnames) for start, end in ranges]
+    table = []
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        for rows in executor.map(parse_csv_range, tasks):
+            if rows is None:
+                executor.shutdown(cancel_futures=True)
+                return read_csv_serial(filename, separator, quote, fieldnames)
+            table.extend(rows)
+    return table
+
+
+def read_csv_as_list_dict_parallel(filename, separator, quote, workers=None):
+    """
+    Inputs:
+      filename  - name of CSV file
+      separator - character that separates fields
+      quote     - character used to optionally quote fields
+      workers   - number of worker processes (default: CPU count)
+    Output:
+      The same list of dictionaries as read_csv_as_list_dict, parsed
+      across a pool of worker processes.
+    """
+    fieldnames = read_csv_fieldnames(filename, separator, quote)
+    if fieldnames is None:
+        return []
+    return read_csv_parallel(filename, separator, quote, fieldnames, workers)
+
+
+def read_csv_as_nested_dict_parallel(filename, keyfield, separator, quote, workers=None):
+    """
+    Inputs:
+      filename  - name of CSV file
+      keyfield  - field to use as key for rows
+      separator - character that separates fields
+      quote     - character used to optionally quote fields
+      workers   - number of worker processes (default: CPU count)
+    Output:
+      The same dictionary of dictionaries as read_csv_as_nested_dict,
+      parsed across a pool of worker processes.
+    """
+    table = read_csv_as_list_dict_parallel(filename, separator, quote, workers)
+    return {row[keyfield]: row for row in table}
+
+
+def write_synthetic_batting_file(filename, num_rows):
+    """
+    Inputs:
+      filename - name of CSV file to create
+      num_rows - number of data rows to write
+    Output:
+      Writes a CSV file shaped like Batting_2016.csv (same columns,
+      random values) for benchmarking.
+    """
+    fieldnames = ["playerID", "yearID", "stint", "teamID", "lgID", "G", "AB", "R", "H",
+                  "2B", "3B", "HR", "RBI", "SB", "CS", "BB", "SO", "IBB", "HBP", "SH",
+                  "SF", "GIDP"]
+    rng = random.Random(0)
+    with open(filename, mode='w', newline='', encoding='utf-8') as csvfile:
+        csvwriter = csv.writer(csvfile)
+        csvwriter.writerow(fieldnames)
+        for index in range(num_rows):
+            csvwriter.writerow([f"player{index % 20000:05d}", 1871 + index % 146, 1,
+                                "TEA", "NL"] + [rng.randint(0, 600) for _ in range(17)])
+
+
+def benchmark_parallel_read(sizes=(100000, 1000000), workers=None):
+    """
+    Inputs:
+      sizes   - numbers of rows of the synthetic files to read
+      workers - number of worker processes (default: CPU count)
+    Output:
+      Prints the time read_csv_as_list_dict and
+      read_csv_as_list_dict_parallel take on synthetic batting files
+      (Batting_2016.csv has about 100000 rows).
+    """
+    with tempfile.TemporaryDirectory() as tempdir:
+        for num_rows in sizes:
+            filename = os.path.join(tempdir, f"batting_{num_rows}.csv")
+            write_synthetic_batting_file(filename, num_rows)
+            for name, reader in (("read_csv_as_list_dict", read_csv_as_list_dict),
+                                 ("read_csv_as_list_dict_parallel",
+                                  lambda *args: read_csv_as_list_dict_parallel(*args, workers))):
+                start = time.perf_counter()
+                reader(filename, ",", '"')
+                seconds = time.perf_counter() - start
+                print(f"{name}: {num_rows} rows in {seconds:.2f} s")
+
+
+def exact_number(value, column_type):
+    """
+    Inputs:
+      value       - string from one CSV field
+      column_type - int or float
+    Output:
+      None if value is empty, and otherwise the number it parses as.
+      Raises ValueError unless str() of that number gives back value
+      exactly, so text such as "02188", "+5", "1_000", " 7", "1.50",
+      "nan" or "inf" is not treated as a number.
+    """
+    if not value:
+        return None
+    number = column_type(value)
+    if str(number) != value or (column_type is float and not math.isfinite(number)):
+        raise ValueError(f"{value!r} does not round-trip as {column_type.__name__}")
+    return number
+
+
+def infer_type(values):
+    """
+    Inputs:
+      values - iterable of strings from one CSV column
+    Output:
+      int if every non-empty value is exactly an integer, float if
+      every non-empty value is exactly a float (see exact_number), and
+      str otherwise (including when every value is empty).
+    """
+    candidates = [int, float]
+    found = False
+    for value in values:
+        if not value:
+            continue
+        found = True
+        for column_type in list(candidates):
+            try:
+                exact_number(value, column_type)
+            except ValueError:
+                candidates.remove(column_type)
+        if not candidates:
+            return str
+    return candidates[0] if found else str
+
+
+def infer_csv_schema(filename, separator, quote, sample_size=1000):
+    """
+    Inputs:
+      filename    - name of CSV file
+      separator   - character that separates fields
+      quote       - character used to optionally quote fields
+      sample_size - number of rows to look at
+    Output:
+      A dictionary mapping each field name to int, float or str,
+      inferred from the first sample_size rows.
+    """
+    with open(filename, mode='r', newline='', encoding='utf-8') as csvfile:
+        csvreader = csv.reader(csvfile, delimiter=separator, quotechar=quote)
+        fieldnames = next(csvreader, [])
+        sample = [row for row in islice(csvreader, sample_size) if row]
+    return {field: infer_type(row[col] for row in sample if col < len(row))
+            for col, field in enumerate(fieldnames)}
+
+
+class RowView(Mapping):
+    """
+    Read-only dictionary view of one row of a CsvTable.
+    """
+    __slots__ = ("table", "index")
+
+    def __init__(self, table, index):
+        self.table = table
+        self.index = index
+
+    def __getitem__(self, field):
+        col = self.table.positions[field]
+        missing = self.table.missing[col]
+        if missing is not None and missing[self.index]:
+            return None
+        return self.table.columns[col][self.index]
+
+    def __iter__(self):
+        return iter(self.table.fieldnames)
+
+    def __len__(self):
+        return len(self.table.fieldnames)
+
+    def __repr__(self):
+        return repr(dict(self))
+
+
+class CsvTable:
+    """
+    Column-oriented CSV table. Integer and float columns are stored in
+    arrays of machine numbers and string columns in lists, so each
+    value is converted once on load and no row repeats the field names.
+    Indexing or iterating yields RowView objects that behave like the
+    dictionaries of read_csv_as_list_dict, but with typed values; an
+    empty field in a numeric column reads as None. str() of a numeric
+    value gives back the text of the file.
+    """
+
+    def __init__(self, schema):
+        self.fieldnames = list(schema)
+        self.types = list(schema.values())
+        self.positions = {field: col for col, field in enumerate(self.fieldnames)}
+        self.columns = [new_column(column_type) for column_type in self.types]
+        self.missing = [None] * len(self.fieldnames)
+        self.num_rows = 0
+
+    def append(self, row):
+        """
+        Add a row given as a list of strings. Empty fields of numeric
+        columns are recorded in a per-column bytearray of flags, created
+        when the column first has one. A value that is not exactly a
+        number of the column's type turns the column into a str column.
+        """
+        if len(row) != len(self.fieldnames):
+            raise ValueError(f"row {self.num_rows + 1} has {len(row)} fields, "
+                             f"expected {len(self.fieldnames)}")
+        for col, value in enumerate(row):
+            column_type = self.types[col]
+            if column_type is not str:
+                try:
+                    self.append_number(col, exact_number(value, column_type))
+                    continue
+                except (ValueError, OverflowError):
+                    self.widen_column(col)
+            self.columns[col].append(value)
+        self.num_rows += 1
+
+    def append_number(self, col, number):
+        """
+        Append number (or None for an empty field) to numeric column col.
+        """
+        missing = self.missing[col]
+        if number is None:
+            if missing is None:
+                missing = self.missing[col] = bytearray(self.num_rows)
+            self.columns[col].append(0)
+            missing.append(1)
+        else:
+            self.columns[col].append(number)
+            if missing is not None:
+                missing.append(0)
+
+    def widen_column(self, col):
+        """
+        Turn numeric column col into a str column. Stored numbers only
+        came from text they format back to exactly, so this rebuilds
+        the original strings.
+        """
+        texts = list(map(str, self.columns[col]))
+        missing = self.missing[col]
+        if missing is not None:
+            for index, flag in enumerate(missing):
+                if flag:
+                    texts[index] = ''
+        self.columns[col] = texts
+        self.types[col] = str
+        self.missing[col] = None
+
+    def column(self, field):
+        """
+        Return the storage (array or list) for the given field.
+        """
+        return self.columns[self.positions[field]]
+
+    def __len__(self):
+        return self.num_rows
+
+    def __getitem__(self, index):
+        if not -self.num_rows <= index < self.num_rows:
+            raise IndexError("table index out of range")
+        return RowView(self, index % self.num_rows)
+
+    def __iter__(self):
+        for index in range(self.num_rows):
+            yield RowView(self, index)
+
+
+def new_column(column_type):
+    """
+    Return empty storage for a column of the given type.
+    """
+    if column_type is int:
+        return array('q')
+    if column_type is float:
+        return array('d')
+    return []
+
+
+def read_csv_as_table(filename, separator, quote, sample_size=1000):
+    """
+    Inputs:
+      filename    - name of CSV file
+      separator   - character that separates fields
+      quote       - character used to optionally quote fields
+      sample_size - number of rows used to infer the column types
+    Output:
+      A CsvTable holding the rows of the CSV file, with column types
+      inferred by infer_csv_schema. Ragged files are rejected: unlike
+      read_csv_as_list_dict, which fills short rows with None and puts
+      extra values under the key None, this raises ValueError for any
+      row that does not have exactly one value per field.
+    """
+    table = CsvTable(infer_csv_schema(filename, separator, quote, sample_size))
+    with open(filename, mode='r', newline='', encoding='utf-8') as csvfile:
+        csvreader = csv.reader(csvfile, delimiter=separator, quotechar=quote)
+        next(csvreader, None)
+        for row in csvreader:
+            if row:
+                table.append(row)
+    return table
+
+
+def benchmark_table_memory(num_rows=100000):
+    """
+    Inputs:
+      num_rows - number of rows of the synthetic batting file
+    Output:
+      Prints the memory held by read_csv_as_list_dict and by
+      read_csv_as_table for the same synthetic batting file.
+    """
+    with tempfile.TemporaryDirectory() as tempdir:
+        filename = os.path.join(tempdir, "batting.csv")
+        write_synthetic_batting_file(filename, num_rows)
+        for name, reader in (("read_csv_as_list_dict", read_csv_as_list_dict),
+                             ("read_csv_as_table", read_csv_as_table)):
+            tracemalloc.start()
+            table = reader(filename, ",", '"')
+            size = tracemalloc.get_traced_memory()[0]
+            tracemalloc.stop()
+            del table
+            print(f"{name}: {size / num_rows:.0f} bytes per row")
+
+
+def table_matches_csv(filename, separator, quote):
+    """
+    Inputs:
+      filename  - name of CSV file
+      separator - character that separates fields
+      quote     - character used to optionally quote fields
+    Output:
+      True if every row of read_csv_as_table, with None shown as ""
+      and numbers shown with str(), equals the matching dictionary of
+      read_csv_as_list_dict.
+    """
+    table = read_csv_as_table(filename, separator, quote)
+    rows = read_csv_as_list_dict(filename, separator, quote)
+    if len(table) != len(rows):
+        return False
+    for view, row in zip(table, rows):
+        text = {field: '' if value is None else str(value) for field, value in view.items()}
+        if text != row:
+            return False
+    return True
+
+
+def check_repo_tables():
+    """
+    Prints the column types read_csv_as_table infers for each CSV file
+    in this repository and whether the table matches
+    read_csv_as_list_dict, or why the file could not be loaded.
+    """
+    root = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+    for filename in sorted(glob.glob(os.path.join(root, "**", "*.csv"), recursive=True)):
+        name = os.path.relpath(filename, root)
+        try:
+            types = read_csv_as_table(filename, ",", '"').types
+        except ValueError as error:
+            print(f"{name}: not loaded ({error})")
+            continue
+        numeric = sum(1 for column_type in types if column_type is not str)
+        status = "ok" if table_matches_csv(filename, ",", '"') else "MISMATCH"
+        print(f"{name}: {numeric}/{len(types)} numeric columns, {status}")
+
+
+CACHE_MAGIC = b"CSVCOL1\n"
+
+
+def file_sha256(filename):
+    """
+    Inputs:
+      filename - name of a file
+    Output:
+      The SHA-256 hex digest of the file contents.
+    """
+    digest = hashlib.sha256()
+    with open(filename, 'rb') as rawfile:
+        for chunk in iter(lambda: rawfile.read(SCAN_BLOCK), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def column_cache_filename(filename, separator, quote):
+    """
+    Inputs:
+      filename  - name of CSV file
+      separator - character that separates fields
+      quote     - character used to optionally quote fields
+    Output:
+      Name of the sidecar cache file for filename read with these options.
+    """
+    options = hashlib.sha256(json.dumps([separator, quote]).encode('utf-8')).hexdigest()
+    return f"{filename}.{options[:12]}.colcache"
+
+
+def write_column_cache(cache_filename, source, fieldnames, columns):
+    """
+    Inputs:
+      cache_filename - name of the sidecar file to write
+      source         - dictionary identifying the CSV file it was built from
+      fieldnames     - list of field names
+      columns        - list of lists of strings, one per field
+    Output:
+      Writes the columns to cache_filename. Each column is stored as the
+      UTF-8 text of its values separated by NUL characters, or, if a
+      value contains NUL, as an array of character offsets followed by
+      the concatenated text. A JSON header records where each part starts.
+    """
+    parts = []
+    layout = []
+    position = 0
+    for column in columns:
+        text = '\0'.join(column)
+        if text.count('\0') == max(len(column) - 1, 0):
+            offsets_bytes = b''
+        else:
+            offsets = array('Q', [0])
+            for value in column:
+                offsets.append(offsets[-1] + len(value))
+            offsets_bytes = offsets.tobytes()
+            text = ''.join(column)
+        text_bytes = text.encode('utf-8')
+        layout.append([position, len(offsets_bytes), len(text_bytes)])
+        parts.extend((offsets_bytes, text_bytes))
+        position += len(offsets_bytes) + len(text_bytes)
+    header = json.dumps({"source": source, "fieldnames": fieldnames,
+                         "num_rows": len(columns[0]) if columns else 0,
+                         "layout": layout}).encode('utf-8')
+    temp_filename = f"{cache_filename}.tmp"
+    try:
+        with open(temp_filename, 'wb') as rawfile:
+            rawfile.write(CACHE_MAGIC)
+            rawfile.write(len(header).to_bytes(8, 'little'))
+            rawfile.write(header)
+            for part in parts:
+                rawfile.write(part)
+        os.replace(temp_filename, cache_filename)
+    except OSError:
+        if os.path.isfile(temp_filename):
+            os.remove(temp_filename)
+        raise
+
+
+def read_column_cache_header(cache_filename):
+    """
+    Inputs:
+      cache_filename - name of a sidecar file
+    Output:
+      A tuple (header, data_start) with the decoded JSON header and the
+      offset where column data begins, or None if the file is missing
+      or not a column cache.
+    """
+    try:
+        with open(cache_filename, 'rb') as rawfile:
+            if rawfile.read(len(CACHE_MAGIC)) != CACHE_MAGIC:
+                return None
+            length = int.from_bytes(rawfile.read(8), 'little')
+            header = json.loads(rawfile.read(length).decode('utf-8'))
+    except (OSError, ValueError):
+        return None
+    return (header, len(CACHE_MAGIC) + 8 + length)
+
+
+def load_column_cache(cache_filename, header, data_start):
+    """
+    Inputs:
+      cache_filename - name of a sidecar file
+      header         - its decoded JSON header
+      data_start     - offset where its column data begins
+    Output:
+      A list of lists of strings, one per field, read from the
+      memory-mapped sidecar file.
+    """
+    columns = []
+    with open(cache_filename, 'rb') as rawfile, \
+            mmap.mmap(rawfile.fileno(), 0, access=mmap.ACCESS_READ) as data:
+        for position, offsets_length, text_length in header["layout"]:
+            start = data_start + position + offsets_length
+            text = str(data[start:start + text_length], 'utf-8')
+            if not header["num_rows"]:
+                columns.append([])
+            elif not offsets_length:
+                columns.append(text.split('\0'))
+            else:
+                offsets = array('Q')
+                offsets.frombytes(data[start - offsets_length:start])
+                columns.append([text[begin:end]
+                                for begin, end in zip(offsets, islice(offsets, 1, None))])
+    return columns
+
+
+def read_csv_columns(filename, separator, quote):
+    """
+    Inputs:
+      filename  - name of CSV file
+      separator - character that separates fields
+      quote     - character used to optionally quote fields
+    Output:
+      A tuple (fieldnames, columns) where columns holds one list of
+      strings per field, or None if some row does not have exactly one
+      value per field (such rows cannot be stored by column).
+    """
+    with open(filename, mode='r', newline='', encoding='utf-8') as csvfile:
+        csvreader = csv.reader(csvfile, delimiter=separator, quotechar=quote)
+        fieldnames = next(csvreader, None)
+        if fieldnames is None:
+            return None
+        columns = [[] for _ in fieldnames]
+        appends = [column.append for column in columns]
+        for row in csvreader:
+            if not row:
+                continue
+            if len(row) != len(fieldnames):
+                return None
+            for append, value in zip(appends, row):
+                append(value)
+    return (fieldnames, columns)
+
+
+def read_csv_as_nested_dict_cached(filename, keyfield, separator, quote):
+    """
+    Inputs:
+      filename  - name of CSV file
+      keyfield  - field to use as key for rows
+      separator - character that separates fields
+      quote     - character used to optionally quote fields
+    Output:
+      The same dictionary of dictionaries as read_csv_as_nested_dict.
+      The first read also writes a binary column-oriented sidecar file
+      next to filename; later reads memory-map that file instead of
+      parsing the CSV text. The sidecar is keyed by separator and quote
+      and records the size, mtime and SHA-256 of the CSV file; it is
+      rebuilt when the contents change. keyfield is applied on load,
+      so one sidecar serves every keyfield. If the sidecar cannot be
+      written, the parsed result is returned without caching.
+    """
+    cache_filename = column_cache_filename(filename, separator, quote)
+    stat = os.stat(filename)
+    cached = read_column_cache_header(cache_filename)
+    columns = None
+    if cached is not None:
+        header, data_start = cached
+        source = header["source"]
+        if source["size"] == stat.st_size and (source["mtime_ns"] == stat.st_mtime_ns
+                                               or source["sha256"] == file_sha256(filename)):
+            fieldnames = header["fieldnames"]
+            columns = load_column_cache(cache_filename, header, data_start)
+    if columns is None:
+        parsed = read_csv_columns(filename, separator, quote)
+        if parsed is None:
+            return read_csv_as_nested_dict(filename, keyfield, separator, quote)
+        fieldnames, columns = parsed
+        source = {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns,
+                  "sha256": file_sha256(filename)}
+        try:
+            write_column_cache(cache_filename, source, fieldnames, columns)
+        except OSError:
+            # The cache is only an optimisation; a read-only or full
+            # directory leaves the parsed columns uncached
+            pass
+
+    if not columns or not columns[0]:
+        return {}
+    if keyfield not in fieldnames:
+        raise KeyError(keyfield)
+    rows = map(dict, map(zip, repeat(fieldnames), zip(*columns)))
+    return dict(zip(columns[fieldnames.index(keyfield)], rows))
+
+
+def benchmark_bulk_write(num_rows=1000000):
+    """
+    Inputs:
+      num_rows - number of rows to write
+    Output:
+      Prints the rows per second written by write_csv_from_list_dict and
+      write_csv_from_list_dict_bulk, plain and gzip-compressed.
+    """
+    fieldnames = ["playerID", "yearID", "AB", "H", "2B", "HR"]
+    table = [{"playerID": f"player{index % 20000:05d}", "yearID": 1871 + index % 146,
+              "AB": index % 600, "H": index % 200, "2B": index % 50, "HR": index % 40}
+             for index in range(num_rows)]
+    writers = (("write_csv_from_list_dict", write_csv_from_list_dict, {}),
+               ("write_csv_from_list_dict_bulk", write_csv_from_list_dict_bulk, {}),
+               ("write_csv_from_list_dict_bulk (gzip)", write_csv_from_list_dict_bulk,
+                {"compression": "gzip"}))
+    with tempfile.TemporaryDirectory() as tempdir:
+        filename = os.path.join(tempdir, "bulk.csv")
+        for name, writer, options in writers:
+            start = time.perf_counter()
+            writer(filename, table, fieldnames, ",", '"', **options)
+            seconds = time.perf_counter() - start
+            print(f"{name}: {num_rows / seconds:,.0f} rows/s, "
+                  f"{os.path.getsize(filename) / 2 ** 20:.1f} MB")
+
+
+if __name__ == "__main__":
+    check_repo_tables()
+    benchmark_parallel_read()
+    benchmark_table_memory()
+    benchmark_bulk_write()